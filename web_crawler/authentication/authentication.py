@@ -3,6 +3,9 @@ from rest_framework import exceptions
 
 from users.models import Token
 from jwt_utils.jwt_validator import jwt_validator
+from jwt_utils.token_digest import token_digest
+from utils.token_cache import token_cache
+from utils.token_denylist import token_denylist
 
 
 class JwtTokensAuthentication(authentication.BaseAuthentication):
@@ -10,7 +13,20 @@ class JwtTokensAuthentication(authentication.BaseAuthentication):
         token_id = request.headers.get("Authorization", "")
         try:
             payload = jwt_validator(token_id)
-            Token.objects.get(access_token=token_id, is_expired=0)
+            if payload.get("type") != "access":
+                raise exceptions.AuthenticationFailed
+            jti = payload.get("jti")
+            if jti and token_denylist.shared:
+                if token_denylist.is_revoked(jti):
+                    raise exceptions.AuthenticationFailed
+            elif jti or token_cache.get(token_id) is None:
+                # other workers' revocations only reach the db without a shared
+                # denylist, tokens issued before jti was added are checked there too
+                Token.objects.get(
+                    access_token_digest=token_digest(token_id), is_expired=0
+                )
+                if not jti:
+                    token_cache.set(token_id, payload)
             return payload, None
         except Exception:
             raise exceptions.AuthenticationFailed(
@@ -0,0 +1,39 @@
+"""
+Throughput of crawler calls, one-off requests.post versus the pooled client.
+
+    python benchmarks/crawler_client.py [requests] [threads]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bootstrap  # noqa: F401
+import requests
+from crawler_stub import start_stub
+
+from utils.crawler_client import CrawlerClient
+
+
+def run(call, total, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda i: call({"query": "q%d" % (i % 50)}), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main(total, threads):
+    server, base_url = start_stub()
+    client = CrawlerClient(base_url, pool_size=threads)
+
+    def unpooled(body):
+        return requests.post(base_url + "fetch/records", json=body).json()
+
+    print("%d requests, %d threads" % (total, threads))
+    for name, call in (("requests.post", unpooled), ("CrawlerClient", client.fetch_records)):
+        print("%-24s %10.1f req/s" % (name, run(call, total, threads)))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [2000, 4][len(args):]))
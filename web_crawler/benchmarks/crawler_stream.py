@@ -0,0 +1,106 @@
+"""
+Peak memory of a platform search as the crawler result grows, parsing the
+whole body versus streaming it through.
+
+    python benchmarks/crawler_stream.py [records ...]
+"""
+import json
+import sys
+import tracemalloc
+from http.server import BaseHTTPRequestHandler
+
+import bootstrap  # noqa: F401
+from crawler_stub import crawler_payload, start_stub
+from rest_framework.renderers import JSONRenderer
+
+from utils.crawler_client import CrawlerClient
+from utils.search_utils import ResultSummaryReader, search_summary
+from web_crawler import settings
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def sized_payload(records):
+    """``records`` patents and innovators, with the summary strings of 20.
+
+    The summary strings are kept by both modes, only the records differ.
+    """
+    payload = crawler_payload(records, records, records)
+    summary = crawler_payload(records)["result"]
+    for section in ("patents", "innovators"):
+        payload["result"][section].update(
+            id=summary[section]["id"], name=summary[section]["name"]
+        )
+    return payload
+
+
+class SizedStubHandler(BaseHTTPRequestHandler):
+    """Answers with ``query`` records of patents and innovators."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    payloads = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        size = int(body["query"])
+        if size not in self.payloads:
+            self.payloads[size] = json.dumps(sized_payload(size)).encode()
+        data = self.payloads[size]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def buffered(client, body):
+    result = client.fetch_records(body)["result"]
+    search_summary(result)
+    return len(JSONRenderer().render({"code": 200, "results": result}))
+
+
+def streamed(client, body):
+    response = client.post("fetch/records", body, stream=True)
+    reader = ResultSummaryReader()
+    sent = 0
+    for chunk in response.iter_content(settings.CRAWLER_STREAM_CHUNK_SIZE):
+        reader.feed(chunk)
+        sent += len(chunk)
+    response.close()
+    search_summary(reader.close())
+    return sent
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(sizes):
+    server, base_url = start_stub(SizedStubHandler)
+    client = CrawlerClient(base_url)
+    print("%10s %12s %16s %16s" % ("records", "body KiB", "buffered KiB", "streamed KiB"))
+    for size in sizes:
+        body = {"query": str(size)}
+        streamed(client, body)  # warm up the stub and the connection
+        print(
+            "%10d %12d %16d %16d"
+            % (
+                size,
+                len(SizedStubHandler.payloads[size]) // 1024,
+                peak_memory(buffered, client, body) // 1024,
+                peak_memory(streamed, client, body) // 1024,
+            )
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
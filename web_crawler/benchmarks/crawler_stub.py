@@ -0,0 +1,63 @@
+"""
+local stand-in for the crawler's fetch/records endpoint
+"""
+import json
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+def crawler_payload(query, patents=20, innovators=20):
+    return {
+        "result": {
+            "search_id": "search-%s" % query,
+            "patents": {
+                "total_count": patents,
+                "id": ",".join("P%06d" % i for i in range(patents)),
+                "name": "; ".join("Patent title number %d" % i for i in range(patents)),
+                "records": [
+                    {"id": "P%06d" % i, "title": "Patent title %d" % i, "country": "IN"}
+                    for i in range(patents)
+                ],
+            },
+            "innovators": {
+                "total_count": innovators,
+                "id": ",".join("I%06d" % i for i in range(innovators)),
+                "name": "; ".join("Innovator %d" % i for i in range(innovators)),
+                "records": [
+                    {"id": "I%06d" % i, "name": "Innovator %d" % i}
+                    for i in range(innovators)
+                ],
+            },
+        }
+    }
+
+
+@lru_cache(maxsize=1024)
+def encoded_payload(query):
+    return json.dumps(crawler_payload(query)).encode()
+
+
+class CrawlerStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        data = encoded_payload(body.get("query", ""))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(handler=CrawlerStubHandler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/" % server.server_port
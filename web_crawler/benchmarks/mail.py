@@ -0,0 +1,117 @@
+"""
+Mails/sec to a local SMTP sink, a thread and connection per mail (the old
+forgot-password path) versus the pooled mail_dispatcher.
+
+    python benchmarks/mail.py [mails] [workers]
+
+The sink has no TLS, against a real server every connection also pays
+for the TLS handshake, so the gap is wider there.
+"""
+import socketserver
+import sys
+import time
+from threading import Lock, Thread
+
+import bootstrap  # noqa: F401
+
+from django.conf import settings as django_settings
+
+from utils.mail_utils import MailDispatcher, send_email
+
+PARAMS = {
+    "html": "users/reset_password_email.html",
+    "subject": "Reset Password Link",
+    "first_name": "Bench",
+    "last_name": "Mark",
+    "reset_url": "http://localhost:8000/?token=x",
+}
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.count("connections")
+        self.reply("220 sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply("250-sink\r\n250-AUTH PLAIN\r\n250 OK")
+            elif command == b"AUTH":
+                self.reply("235 OK")
+            elif command == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.count("messages")
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # every mail of the thread per mail run connects at once
+    request_queue_size = 1024
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SinkHandler)
+        self.lock = Lock()
+        self.counts = {"connections": 0, "messages": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def thread_per_mail(total, workers):
+    threads = [
+        Thread(target=send_email, args=("%d@example.com" % i, PARAMS))
+        for i in range(total)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def dispatcher(total, workers):
+    mail_dispatcher = MailDispatcher(workers, 50, total, 30)
+    for i in range(total):
+        mail_dispatcher.send("%d@example.com" % i, PARAMS)
+    mail_dispatcher.join()
+
+
+def main(total, workers):
+    server = SinkServer()
+    Thread(target=server.serve_forever, daemon=True).start()
+    django_settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    django_settings.EMAIL_HOST, django_settings.EMAIL_PORT = server.server_address
+    django_settings.EMAIL_USE_TLS = False
+
+    print("%d mails, %d dispatcher workers" % (total, workers))
+    for name, run in (("thread per mail", thread_per_mail), ("dispatcher", dispatcher)):
+        server.counts = {"connections": 0, "messages": 0}
+        start = time.perf_counter()
+        run(total, workers)
+        elapsed = time.perf_counter() - start
+        print(
+            "%-16s %10.1f mails/s %6d connections"
+            % (name, total / elapsed, server.counts["connections"])
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [500, 2][len(args):]))
@@ -0,0 +1,69 @@
+"""
+Latency of the first and a deep page of the search history list.
+
+    python benchmarks/pagination.py [page]
+
+Compares page numbers (COUNT plus OFFSET) with the (created_at, id) cursor.
+"""
+import sys
+
+from bootstrap import test_database, timed
+
+from django.contrib.auth import get_user_model
+from django.test import Client
+
+from jwt_utils.token_session import create_session
+from users.models import UserSearch
+from utils.pagination import CreatedAtCursorPagination
+
+DEFAULT_PAGE = 1000
+PAGE_SIZE = CreatedAtCursorPagination.page_size
+BATCH_SIZE = 5000
+REQUESTS = 50
+
+
+def fill_history(user, rows):
+    for start in range(0, rows, BATCH_SIZE):
+        UserSearch.objects.bulk_create(
+            UserSearch(
+                user_id=user,
+                search_value="query %d" % number,
+                search_result_id="search-%d" % number,
+            )
+            for number in range(start, min(rows, start + BATCH_SIZE))
+        )
+
+
+def main(page):
+    with test_database():
+        user = get_user_model().objects.create_user(
+            {"email": "bench@example.com", "password": "passw0rd!"}
+        )
+        fill_history(user, page * PAGE_SIZE + PAGE_SIZE)
+        access_token, _ = create_session(user)
+        client = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=access_token)
+
+        offset = (page - 1) * PAGE_SIZE
+        position = (
+            UserSearch.objects.filter(user_id=user)
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")[offset - 1]
+        )
+        deep_cursor = CreatedAtCursorPagination().encode_cursor(position)
+
+        def get(params):
+            return lambda: client.get("/user/user-search", params)
+
+        print("%-14s %14s %14s" % ("", "page 1 ms", "page %d ms" % page))
+        for name, first, deep in (
+            ("page numbers", get({}), get({"page": page})),
+            ("cursor", get({"cursor": ""}), get({"cursor": deep_cursor})),
+        ):
+            print(
+                "%-14s %14.3f %14.3f"
+                % (name, timed(first, REQUESTS) * 1000, timed(deep, REQUESTS) * 1000)
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PAGE)
@@ -0,0 +1,60 @@
+"""
+Encode time and size of typical responses per renderer.
+
+    python benchmarks/renderers.py
+
+Payloads are a platform-search response around a crawler result and a
+200-row search history page.
+"""
+from datetime import datetime, timedelta
+
+import bootstrap  # noqa: F401
+from bootstrap import timed
+from crawler_stub import crawler_payload
+from rest_framework.renderers import JSONRenderer
+
+from utils.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+
+REPEAT = 200
+
+
+def history_page(rows=200):
+    now = datetime.now()
+    return {
+        "count": 5000,
+        "next": "http://localhost/user/user-search?page=2",
+        "previous": None,
+        "results": [
+            {
+                "search_value": "query %d" % number,
+                "search_count": number,
+                "search_result_id": "search-%d" % number,
+                "created_at": now - timedelta(minutes=number),
+            }
+            for number in range(rows)
+        ],
+    }
+
+
+def main():
+    payloads = [
+        ("crawler result", crawler_payload("aspirin", 200, 200)),
+        ("200-row page", history_page()),
+    ]
+    renderers = [("JSONRenderer", JSONRenderer()), ("ORJSONRenderer", ORJSONRenderer())]
+    if msgpack is not None:
+        renderers.append(("MessagePackRenderer", MessagePackRenderer()))
+
+    print("%-16s %-20s %12s %10s" % ("payload", "renderer", "encode ms", "bytes"))
+    for payload_name, payload in payloads:
+        data = {"code": 200, "message": "Ok", "results": payload}
+        for name, renderer in renderers:
+            size = len(renderer.render(data))
+            seconds = timed(lambda: renderer.render(data), REPEAT)
+            print(
+                "%-16s %-20s %12.3f %10d" % (payload_name, name, seconds * 1000, size)
+            )
+
+
+if __name__ == "__main__":
+    main()
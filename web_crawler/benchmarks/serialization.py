@@ -0,0 +1,53 @@
+"""
+Rows/sec of a search history page, model instances through the DRF
+serializer versus values() rows through the compiled serializer.
+
+    python benchmarks/serialization.py [rows]
+"""
+import sys
+
+from bootstrap import test_database, timed
+
+from django.contrib.auth import get_user_model
+
+from users.models import UserSearch
+from users.serializers import UserSearchSerializer
+from utils.serializer_utils import compile_serializer
+
+DEFAULT_ROWS = 10000
+REPEAT = 5
+
+
+def main(rows):
+    with test_database():
+        user = get_user_model().objects.create_user(
+            {"email": "bench@example.com", "password": "passw0rd!"}
+        )
+        UserSearch.objects.bulk_create(
+            (
+                UserSearch(
+                    user_id=user,
+                    search_value="query %d" % number,
+                    search_result_id="search-%d" % number,
+                )
+                for number in range(rows)
+            ),
+            batch_size=500,
+        )
+        queryset = UserSearch.objects.filter(user_id=user).order_by("-created_at")
+        compiled = compile_serializer(UserSearchSerializer)
+
+        def instances():
+            return UserSearchSerializer(queryset.all(), many=True).data
+
+        def projected():
+            return compiled(queryset.values(*compiled.columns))
+
+        assert instances() == projected()
+        print("%d rows per page" % rows)
+        for name, page in (("instances", instances), ("values()", projected)):
+            print("%-12s %12.0f rows/s" % (name, rows / timed(page, REPEAT)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
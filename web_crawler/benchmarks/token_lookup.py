@@ -0,0 +1,74 @@
+"""
+Token lookup latency as the Token table grows.
+
+    python benchmarks/token_lookup.py [rows ...]
+
+Compares the indexed digest lookup against the old exact match on the
+unindexed access_token text column.
+"""
+import random
+import sys
+import uuid
+
+from bootstrap import test_database, timed
+
+from jwt_utils.token_digest import token_digest
+from users.models import Token
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+BATCH_SIZE = 5000
+DIGEST_LOOKUPS = 1000
+TEXT_LOOKUPS = 5
+
+
+def grow_table(current, target):
+    while current < target:
+        size = min(BATCH_SIZE, target - current)
+        rows = []
+        for _ in range(size):
+            access_token = uuid.uuid4().hex * 4
+            refresh_token = uuid.uuid4().hex * 4
+            rows.append(
+                Token(
+                    access_token=access_token,
+                    refresh_token=refresh_token,
+                    access_token_digest=token_digest(access_token),
+                    refresh_token_digest=token_digest(refresh_token),
+                    is_expired=True,
+                )
+            )
+        Token.objects.bulk_create(rows)
+        current += size
+    return current
+
+
+def main(sizes):
+    with test_database():
+        rows = 0
+        print("%12s %18s %18s" % ("rows", "digest lookup ms", "text lookup ms"))
+        for size in sizes:
+            rows = grow_table(rows, size)
+            samples = list(
+                Token.objects.order_by("?").values_list("access_token", flat=True)[:50]
+            )
+
+            def by_digest():
+                token = random.choice(samples)
+                Token.objects.filter(access_token_digest=token_digest(token)).first()
+
+            def by_text():
+                token = random.choice(samples)
+                Token.objects.filter(access_token=token).first()
+
+            print(
+                "%12d %18.3f %18.3f"
+                % (
+                    rows,
+                    timed(by_digest, DIGEST_LOOKUPS) * 1000,
+                    timed(by_text, TEXT_LOOKUPS) * 1000,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 
 import jwt
@@ -21,6 +22,7 @@ def jwt_generator(user_id, jwt_secret, jwt_ttl, token_type, is_admin):
         "type": token_type,
         "issued_at": time,
         "exp": actual_exp.timestamp(),
+        "jti": uuid.uuid4().hex,
     }
     jwt_token = jwt.encode(payload, jwt_secret, ALGORITHM)
     return jwt_token.decode()
@@ -4,7 +4,6 @@ class used for jwt validator
 import jwt
 from rest_framework import exceptions
 
-from users.models import Token
 from web_crawler import settings
 
 jwt_secret = settings.JWT_SECRET
@@ -20,9 +19,9 @@ def jwt_validator(token):
 
 
 def refresh_token_validator(token):
+    """Only checks the signature, the Token row is claimed by rotate_session."""
     try:
         payload = jwt.decode(token, jwt_secret, algorithm="HS256", options=options)
-        Token.objects.get(refresh_token=token, is_expired=0)
         return payload
     except Exception:
         return None
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+fixed width digest used to index and look up stored tokens
+"""
+import hashlib
+
+
+def token_digest(token):
+    if not token:
+        return None
+    return hashlib.sha256(token.encode()).hexdigest()
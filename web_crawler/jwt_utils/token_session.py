@@ -0,0 +1,92 @@
+"""
+helpers to issue and revoke the token pair of a login session
+"""
+from datetime import datetime
+
+import jwt
+from django.db import transaction
+
+from jwt_utils.jwt_generator import jwt_generator
+from jwt_utils.token_digest import token_digest
+from users.models import Token
+from utils.token_cache import token_cache
+from utils.token_denylist import token_denylist
+from web_crawler import settings
+
+# the Token columns needed to deny a session
+SESSION_FIELDS = ("access_token", "access_jti", "refresh_jti", "expires_at")
+
+
+def read_payload(token):
+    return jwt.decode(token, options={"verify_signature": False})
+
+
+def create_session(user_obj):
+    access_token = jwt_generator(
+        user_obj.id,
+        settings.JWT_SECRET,
+        settings.TOKEN_EXPIRY,
+        "access",
+        user_obj.is_superuser,
+    )
+    refresh_token = jwt_generator(
+        user_obj.id,
+        settings.JWT_SECRET,
+        settings.REFRESH_TOKEN_EXPIRY,
+        "refresh",
+        user_obj.is_superuser,
+    )
+    access_payload = read_payload(access_token)
+    refresh_payload = read_payload(refresh_token)
+    expires_at = max(access_payload["exp"], refresh_payload["exp"])
+    Token.objects.create(
+        user_id=user_obj,
+        access_token=access_token,
+        refresh_token=refresh_token,
+        access_jti=access_payload["jti"],
+        refresh_jti=refresh_payload["jti"],
+        expires_at=datetime.fromtimestamp(expires_at),
+    )
+    return access_token, refresh_token
+
+
+def rotate_session(user_obj, refresh_token=None):
+    """Expire the active session of ``user_obj`` and issue a new token pair.
+
+    Both steps run in one transaction and only touch the user's active rows.
+    With ``refresh_token`` only the session owning it is rotated, concurrent
+    callers race on that single row and all but one get None back. Only the
+    sessions expired here are denied.
+    """
+    sessions = Token.objects.filter(user_id=user_obj, is_expired=False)
+    if refresh_token is not None:
+        sessions = sessions.filter(refresh_token_digest=token_digest(refresh_token))
+    with transaction.atomic():
+        rows = list(sessions.values("pk", *SESSION_FIELDS))
+        expired = Token.objects.filter(
+            pk__in=[row["pk"] for row in rows], is_expired=False
+        ).update(is_expired=True, updated_at=datetime.now())
+        if refresh_token is not None and not expired:
+            return None
+        tokens = create_session(user_obj)
+    if expired:
+        deny_sessions(rows)
+    return tokens
+
+
+def deny_sessions(rows):
+    """Deny the jwt ids of expired Token ``rows`` (dicts of SESSION_FIELDS)."""
+    for row in rows:
+        token_cache.invalidate(row["access_token"])
+        if row["expires_at"] is None:
+            continue
+        exp = row["expires_at"].timestamp()
+        token_denylist.revoke(row["access_jti"], exp)
+        token_denylist.revoke(row["refresh_jti"], exp)
+
+
+def revoke_sessions(queryset):
+    """Expire the Token rows of ``queryset`` and deny their jwt ids."""
+    rows = list(queryset.filter(is_expired=False).values(*SESSION_FIELDS))
+    queryset.update(is_expired=1)
+    deny_sessions(rows)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users.models import UserSearchDaily
+from utils.datetime_utils import convert_str_date
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily search rollups from the UserSearch table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from", dest="start", type=convert_str_date, help="first day, YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--to", dest="end", type=convert_str_date, help="last day, YYYY-MM-DD"
+        )
+
+    def handle(self, *args, **options):
+        count = UserSearchDaily.objects.rebuild(options["start"], options["end"])
+        self.stdout.write(self.style.SUCCESS("%d daily rollups rebuilt" % count))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from utils.retention import get_policies
+from web_crawler import settings
+
+
+class Command(BaseCommand):
+    help = "Delete rows older than the configured RETENTION_POLICIES in small chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.RETENTION_CHUNK_SIZE
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=settings.RETENTION_CHUNK_PAUSE,
+            help="seconds to sleep between chunks",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        for policy in get_policies():
+            total = 0
+            chunks = policy.enforce(
+                options["chunk_size"], options["pause"], options["dry_run"]
+            )
+            for number, (deleted, seconds) in enumerate(chunks, 1):
+                total += deleted
+                self.stdout.write(
+                    "%s chunk %d: %d rows in %.3fs"
+                    % (policy.model, number, deleted, seconds)
+                )
+            action = "matched" if options["dry_run"] else "removed"
+            self.stdout.write(
+                self.style.SUCCESS("%s: %d rows %s" % (policy.model, total, action))
+            )
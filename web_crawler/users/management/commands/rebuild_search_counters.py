@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.models import UserSearchCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user dashboard counters from the UserSearch table"
+
+    def handle(self, *args, **options):
+        count = UserSearchCounter.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS("%d user counters rebuilt" % count))
@@ -0,0 +1,82 @@
+import signal
+from multiprocessing import Process
+from threading import Event
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from utils.job_queue import JobWorker
+from web_crawler import settings
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the Job table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.JOB_WORKER_THREADS,
+            help="jobs running at the same time in each process",
+        )
+        parser.add_argument(
+            "--processes", type=int, default=1, help="worker processes to start"
+        )
+        parser.add_argument(
+            "--queues",
+            help="comma separated queues to work on, all of JOB_QUEUES by default",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="exit once no job is due instead of waiting for new ones",
+        )
+
+    def handle(self, *args, **options):
+        queues = dict(settings.JOB_QUEUES)
+        if options["queues"]:
+            names = [name.strip() for name in options["queues"].split(",")]
+            unknown = [name for name in names if name not in queues]
+            if unknown:
+                raise CommandError("unknown queues: %s" % ", ".join(unknown))
+            queues = {name: queues[name] for name in names}
+
+        if options["processes"] <= 1:
+            self.work(queues, options["threads"], options["burst"])
+            return
+        # children must not share the parent's database connections
+        connections.close_all()
+        processes = [
+            Process(
+                target=self.work, args=(queues, options["threads"], options["burst"])
+            )
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+    def work(self, queues, threads, burst):
+        stop = Event()
+        # running jobs are finished before the worker exits
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        worker = JobWorker(
+            queues, threads, settings.JOB_POLL_INTERVAL, settings.JOB_LOCK_TIMEOUT
+        )
+        try:
+            worker.run(stop, burst=burst)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%s: %d done, %d retried, %d failed"
+                % (worker.name, worker.done, worker.retried, worker.failed)
+            )
+        )
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.models import Job
+from utils.monitoring import run_monitoring_cycle
+from web_crawler import settings
+
+
+class Command(BaseCommand):
+    help = "Periodically re-run monitored searches and notify users of new results"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.MONITORING_INTERVAL,
+            help="seconds from the start of one cycle to the next",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.MONITORING_WORKERS,
+            help="crawler calls running at the same time",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.MONITORING_CHUNK_SIZE
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="run a single cycle and exit"
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="queue a single cycle for run_jobs and exit",
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue"]:
+            # the next scheduled cycle is the retry
+            job = Job.objects.enqueue(
+                "utils.monitoring.run_monitoring_cycle",
+                args=(options["workers"], options["chunk_size"]),
+                queue="monitoring",
+                max_attempts=1,
+            )
+            self.stdout.write(self.style.SUCCESS("queued job %d" % job.pk))
+            return
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            stats = run_monitoring_cycle(options["workers"], options["chunk_size"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "%(queries)d queries, %(failed)d failed, "
+                    "%(notifications)d notifications, %(unchanged)d unchanged" % stats
+                )
+            )
+            if options["once"]:
+                return
+            time.sleep(max(0, options["interval"] - (time.monotonic() - started)))
@@ -0,0 +1,51 @@
+# Generated by Django 3.0 on 2026-10-18 10:30
+
+import hashlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def _digest(token):
+    if not token:
+        return None
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def backfill_token_digests(apps, schema_editor):
+    Token = apps.get_model("users", "Token")
+    batch = []
+    rows = Token.objects.only("id", "access_token", "refresh_token").order_by("id")
+    for token in rows.iterator(chunk_size=BATCH_SIZE):
+        token.access_token_digest = _digest(token.access_token)
+        token.refresh_token_digest = _digest(token.refresh_token)
+        batch.append(token)
+        if len(batch) >= BATCH_SIZE:
+            Token.objects.bulk_update(
+                batch, ["access_token_digest", "refresh_token_digest"]
+            )
+            batch = []
+    if batch:
+        Token.objects.bulk_update(batch, ["access_token_digest", "refresh_token_digest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='access_token_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='refresh_token_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_token_digests, migrations.RunPython.noop),
+    ]
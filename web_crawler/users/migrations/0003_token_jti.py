@@ -0,0 +1,28 @@
+# Generated by Django 3.0 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_token_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='access_jti',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='refresh_jti',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
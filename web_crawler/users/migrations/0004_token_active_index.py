@@ -0,0 +1,17 @@
+# Generated by Django 3.0 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_token_jti'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['user_id', 'is_expired'], name='users_token_user_id_9ed673_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.0 on 2026-10-18 10:39
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def merge_duplicate_searches(apps, schema_editor):
+    """Fold rows sharing (user_id, search_result_id) into the oldest one.
+
+    Rows with a NULL in either column never collide and are left alone.
+    """
+    UserSearch = apps.get_model("users", "UserSearch")
+    duplicates = (
+        UserSearch.objects.filter(user_id__isnull=False, search_result_id__isnull=False)
+        .values("user_id", "search_result_id")
+        .annotate(
+            rows=Count("id"),
+            keep_id=Min("id"),
+            total=Sum("search_count"),
+            last_update=Max("updated_at"),
+        )
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in list(duplicates):
+        group = UserSearch.objects.filter(
+            user_id=duplicate["user_id"],
+            search_result_id=duplicate["search_result_id"],
+        )
+        monitored = group.filter(needs_monitoring=True).exists()
+        group.filter(id=duplicate["keep_id"]).update(
+            search_count=duplicate["total"],
+            updated_at=duplicate["last_update"],
+            needs_monitoring=monitored,
+        )
+        group.exclude(id=duplicate["keep_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_token_active_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_searches, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usersearch',
+            constraint=models.UniqueConstraint(fields=('user_id', 'search_result_id'), name='unique_user_search_result'),
+        ),
+    ]
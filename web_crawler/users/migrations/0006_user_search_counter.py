@@ -0,0 +1,55 @@
+# Generated by Django 3.0 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_search_counters(apps, schema_editor):
+    UserSearch = apps.get_model("users", "UserSearch")
+    UserSearchCounter = apps.get_model("users", "UserSearchCounter")
+    totals = (
+        UserSearch.objects.filter(user_id__isnull=False)
+        .values("user_id")
+        .annotate(
+            searches=Count("search_value"),
+            patents=Sum("patent_count"),
+            innovators=Sum("innovator_count"),
+        )
+        .order_by()
+    )
+    UserSearchCounter.objects.bulk_create(
+        (
+            UserSearchCounter(
+                user_id_id=total["user_id"],
+                search_count=total["searches"],
+                patent_count=total["patents"] or 0,
+                innovator_count=total["innovators"] or 0,
+            )
+            for total in totals.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_unique_user_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search_count', models.IntegerField(default=0)),
+                ('patent_count', models.BigIntegerField(default=0)),
+                ('innovator_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_search_counters, migrations.RunPython.noop),
+    ]
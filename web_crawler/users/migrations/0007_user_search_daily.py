@@ -0,0 +1,63 @@
+# Generated by Django 3.0 on 2026-10-18 10:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def fill_search_rollups(apps, schema_editor):
+    UserSearch = apps.get_model("users", "UserSearch")
+    UserSearchDaily = apps.get_model("users", "UserSearchDaily")
+    totals = (
+        UserSearch.objects.filter(user_id__isnull=False)
+        .annotate(created_on=TruncDate("created_at"))
+        .values("user_id", "created_on")
+        .annotate(
+            searches=Count("search_value"),
+            patents=Sum("patent_count"),
+            innovators=Sum("innovator_count"),
+        )
+        .order_by()
+    )
+    UserSearchDaily.objects.bulk_create(
+        (
+            UserSearchDaily(
+                user_id_id=total["user_id"],
+                day=total["created_on"],
+                search_count=total["searches"],
+                patent_count=total["patents"] or 0,
+                innovator_count=total["innovators"] or 0,
+            )
+            for total in totals.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_search_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('search_count', models.IntegerField(default=0)),
+                ('patent_count', models.BigIntegerField(default=0)),
+                ('innovator_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchdaily',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day'), name='unique_user_search_day'),
+        ),
+        migrations.RunPython(fill_search_rollups, migrations.RunPython.noop),
+    ]
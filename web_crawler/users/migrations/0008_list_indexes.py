@@ -0,0 +1,29 @@
+# Generated by Django 3.0 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_search_daily'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usernote',
+            index=models.Index(fields=['user_id', 'created_at'], name='users_usern_user_id_c73c42_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearch',
+            index=models.Index(fields=['user_id', 'created_at'], name='users_users_user_id_95a00b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearch',
+            index=models.Index(fields=['user_id', 'needs_monitoring', 'created_at'], name='users_users_user_id_7122e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearch',
+            index=models.Index(fields=['search_result_id'], name='users_users_search__a310ef_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookmark',
+            index=models.Index(fields=['user_id', 'created_at'], name='users_userb_user_id_6402c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user_id', 'created_at'], name='users_usern_user_id_3526ee_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_bookmark_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersearch',
+            name='monitored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usersearch',
+            name='monitored_innovator_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usersearch',
+            name='monitored_patent_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='usersearch',
+            index=models.Index(fields=['needs_monitoring', 'search_value'], name='users_users_needs_m_f3fae4_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_search_monitoring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search_result_id', models.CharField(max_length=100, unique=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('patent_count', models.IntegerField(default=0)),
+                ('patent_id', models.TextField(blank=True, default='')),
+                ('innovator_count', models.IntegerField(default=0)),
+                ('innovator_id', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 3.0 on 2026-10-18 11:01
+
+import hashlib
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+PAYLOAD_FIELDS = ("patent_id", "patent_name", "innovator_id", "innovator_name")
+# results held in memory before they are written
+BATCH_SIZE = 1000
+
+
+def payload_bytes(row):
+    return sum(len((row[name] or "").encode()) for name in PAYLOAD_FIELDS)
+
+
+def content_hash(row):
+    content = "\n".join(
+        str(row[name] or "")
+        for name in ("patent_count", "patent_id", "innovator_count", "innovator_id")
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def save_results(SearchResult, created, updated):
+    SearchResult.objects.bulk_create(created, batch_size=500)
+    SearchResult.objects.bulk_update(
+        updated, ["patent_name", "innovator_name"], batch_size=500
+    )
+    created.clear()
+    updated.clear()
+
+
+def share_search_results(apps, schema_editor):
+    """Store each search_result_id's payload once, BATCH_SIZE results at a time."""
+    UserSearch = apps.get_model("users", "UserSearch")
+    SearchResult = apps.get_model("users", "SearchResult")
+    # monitoring snapshots already have the ids, the ones without names get them
+    existing = set(SearchResult.objects.values_list("search_result_id", flat=True))
+    unnamed = dict(
+        SearchResult.objects.filter(patent_name="", innovator_name="").values_list(
+            "search_result_id", "pk"
+        )
+    )
+    rows = (
+        UserSearch.objects.order_by("search_result_id", "-updated_at")
+        .values(
+            "id", "search_result_id", "patent_count", "innovator_count", *PAYLOAD_FIELDS
+        )
+        .iterator()
+    )
+    created, updated, unkeyed = [], [], {}
+    last_id = None
+    for row in rows:
+        search_result_id = row["search_result_id"]
+        if not search_result_id:
+            if not payload_bytes(row):
+                continue
+            # nothing to share the payload with, it gets a result of its own
+            search_result_id = "usersearch-%d" % row["id"]
+            unkeyed[search_result_id] = row["id"]
+        elif search_result_id == last_id:
+            continue
+        last_id = search_result_id
+        if search_result_id in unnamed:
+            updated.append(
+                SearchResult(
+                    pk=unnamed[search_result_id],
+                    patent_name=row["patent_name"] or "",
+                    innovator_name=row["innovator_name"] or "",
+                )
+            )
+        elif search_result_id not in existing:
+            created.append(
+                SearchResult(
+                    search_result_id=search_result_id,
+                    content_hash=content_hash(row),
+                    patent_count=row["patent_count"] or 0,
+                    innovator_count=row["innovator_count"] or 0,
+                    **{name: row[name] or "" for name in PAYLOAD_FIELDS}
+                )
+            )
+        if len(created) + len(updated) >= BATCH_SIZE:
+            save_results(SearchResult, created, updated)
+    save_results(SearchResult, created, updated)
+
+    UserSearch.objects.filter(search_result_id__isnull=False).exclude(
+        search_result_id=""
+    ).update(
+        result=Subquery(
+            SearchResult.objects.filter(
+                search_result_id=OuterRef("search_result_id")
+            ).values("pk")[:1]
+        )
+    )
+    results = SearchResult.objects.filter(search_result_id__in=unkeyed)
+    for search_result_id, pk in results.values_list("search_result_id", "pk"):
+        UserSearch.objects.filter(pk=unkeyed[search_result_id]).update(result=pk)
+
+
+def restore_search_payloads(apps, schema_editor):
+    UserSearch = apps.get_model("users", "UserSearch")
+    SearchResult = apps.get_model("users", "SearchResult")
+    UserSearch.objects.filter(result__isnull=False).update(
+        **{
+            name: Subquery(
+                SearchResult.objects.filter(pk=OuterRef("result")).values(name)[:1]
+            )
+            for name in PAYLOAD_FIELDS
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_search_result_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchresult',
+            name='innovator_name',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='searchresult',
+            name='patent_name',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='usersearch',
+            name='result',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='searches', to='users.SearchResult'),
+        ),
+        migrations.RunPython(share_search_results, restore_search_payloads),
+        migrations.RemoveField(
+            model_name='usersearch',
+            name='innovator_id',
+        ),
+        migrations.RemoveField(
+            model_name='usersearch',
+            name='innovator_name',
+        ),
+        migrations.RemoveField(
+            model_name='usersearch',
+            name='patent_id',
+        ),
+        migrations.RemoveField(
+            model_name='usersearch',
+            name='patent_name',
+        ),
+    ]
@@ -1,9 +1,18 @@
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from django.db import connections, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
 # Create your models here.
+from jwt_utils.token_digest import token_digest
+from utils.db_utils import upsert
 from web_crawler import settings
 
 
@@ -103,10 +112,158 @@ class Token(models.Model):
     )
     refresh_token = models.TextField(blank=True, null=True)
     access_token = models.TextField(blank=True, null=True)
+    # sha256 of the tokens above, tokens are always looked up through these
+    refresh_token_digest = models.CharField(
+        blank=True, null=True, max_length=64, db_index=True
+    )
+    access_token_digest = models.CharField(
+        blank=True, null=True, max_length=64, db_index=True
+    )
+    access_jti = models.CharField(blank=True, null=True, max_length=32)
+    refresh_jti = models.CharField(blank=True, null=True, max_length=32)
+    # expiry of the longest lived token of the pair
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
     is_expired = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "is_expired"])]
+
+    def save(self, *args, **kwargs):
+        self.refresh_token_digest = token_digest(self.refresh_token)
+        self.access_token_digest = token_digest(self.access_token)
+        super().save(*args, **kwargs)
+
+
+def summary_hash(summary):
+    """sha256 of the counts and ids of a crawler result summary."""
+    content = "\n".join(
+        str(summary.get(name) or "")
+        for name in ("patent_count", "patent_id", "innovator_count", "innovator_id")
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class SearchResult(models.Model):
+    """Crawler result shared by the UserSearch rows with its search_result_id.
+
+    Written once when a result is first seen and by monitoring runs after
+    that. ``content_hash`` covers the counts and ids, a run that gets the
+    same hash back skips the result without looking at its rows.
+    """
+
+    RESULT_FIELDS = (
+        "patent_count",
+        "patent_id",
+        "patent_name",
+        "innovator_count",
+        "innovator_id",
+        "innovator_name",
+    )
+
+    search_result_id = models.CharField(max_length=100, unique=True)
+    content_hash = models.CharField(max_length=64)
+    patent_count = models.IntegerField(default=0)
+    patent_id = models.TextField(blank=True, default="")
+    patent_name = models.TextField(blank=True, default="")
+    innovator_count = models.IntegerField(default=0)
+    innovator_id = models.TextField(blank=True, default="")
+    innovator_name = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class UserSearchManager(models.Manager):
+    def record_hits(self, rows):
+        """Upsert search hits and count newly inserted rows in the rollups.
+
+        ``rows`` are dicts of UserSearch fields plus the SearchResult ones,
+        one per (user_id, search_result_id), with the number of hits in
+        ``search_count``. Results seen for the first time are stored once in
+        SearchResult, rows point at them.
+        """
+        if not rows:
+            return
+        now = datetime.now()
+        results = {}
+        for row in rows:
+            if row["search_result_id"]:
+                results.setdefault(
+                    row["search_result_id"],
+                    # missing and null fields get the model defaults
+                    dict(
+                        {
+                            name: row[name]
+                            for name in SearchResult.RESULT_FIELDS
+                            if row.get(name) is not None
+                        },
+                        search_result_id=row["search_result_id"],
+                        content_hash=summary_hash(row),
+                    ),
+                )
+        rows = [
+            dict(row, user_id=getattr(row["user_id"], "pk", row["user_id"]))
+            for row in rows
+        ]
+        with transaction.atomic(using=self.db):
+            # rows whose key is missing now are the ones this upsert inserts
+            existing = set(
+                self.filter(
+                    user_id__in={row["user_id"] for row in rows},
+                    search_result_id__in={row["search_result_id"] for row in rows},
+                ).values_list("user_id", "search_result_id")
+            )
+            inserted = [
+                (
+                    row["user_id"],
+                    row.get("search_value"),
+                    row.get("patent_count"),
+                    row.get("innovator_count"),
+                )
+                for row in rows
+                if row["user_id"] is not None
+                and (row["user_id"], row["search_result_id"]) not in existing
+            ]
+            # an existing result is kept, monitoring runs refresh it
+            upsert(SearchResult, list(results.values()), ["search_result_id"])
+            result_ids = dict(
+                SearchResult.objects.filter(search_result_id__in=results).values_list(
+                    "search_result_id", "pk"
+                )
+            )
+            rows = [
+                dict(
+                    row,
+                    result=result_ids.get(row["search_result_id"]),
+                    created_at=now,
+                    updated_at=now,
+                )
+                for row in rows
+            ]
+            upsert(
+                self.model,
+                rows,
+                conflict_fields=["user_id", "search_result_id"],
+                increment_fields=["search_count"],
+                update_fields=["result", "updated_at"],
+            )
+            UserSearchCounter.objects.add(inserted)
+            UserSearchDaily.objects.add(inserted, now.date())
+
+    def delete_rows(self, pks):
+        """Delete the rows of ``pks`` and take them out of the counters.
+
+        The daily rollups keep them, they are the history of past days.
+        """
+        with transaction.atomic(using=self.db):
+            searches = self.filter(pk__in=pks, user_id__isnull=False).values_list(
+                "user_id", "search_value", "patent_count", "innovator_count"
+            )
+            UserSearchCounter.objects.remove(list(searches))
+            deleted, _ = self.filter(pk__in=pks).delete()
+        return deleted
+
 
 class UserSearch(models.Model):
     user_id = models.ForeignKey(
@@ -117,15 +274,193 @@ class UserSearch(models.Model):
     needs_monitoring = models.BooleanField(default=False)
     search_count = models.IntegerField(default=0)
     search_result_id = models.CharField(blank=True, null=True, max_length=100)
+    result = models.ForeignKey(
+        SearchResult,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="searches",
+    )
+    # counts when the user ran the search, the dashboard totals add these up
     patent_count = models.IntegerField(default=0, null=True, blank=True)
-    patent_id = models.CharField(blank=True, null=True, max_length=500)
-    patent_name = models.TextField(blank=True, null=True)
     innovator_count = models.IntegerField(default=0, null=True, blank=True)
-    innovator_id = models.CharField(blank=True, null=True, max_length=500)
-    innovator_name = models.TextField(blank=True, null=True)
+    # counts the last monitoring run saw, patent/innovator_count until then
+    monitored_patent_count = models.IntegerField(null=True, blank=True)
+    monitored_innovator_count = models.IntegerField(null=True, blank=True)
+    monitored_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserSearchManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_id", "search_result_id"], name="unique_user_search_result"
+            )
+        ]
+        indexes = [
+            # search history and monitoring lists, newest first
+            models.Index(fields=["user_id", "created_at"]),
+            models.Index(fields=["user_id", "needs_monitoring", "created_at"]),
+            models.Index(fields=["search_result_id"]),
+            # distinct monitored queries, walked by run_monitoring
+            models.Index(fields=["needs_monitoring", "search_value"]),
+        ]
+
+
+def search_totals(searches, **fields):
+    """Sum ``(user_id, search_value, patent_count, innovator_count)`` rows per user."""
+    totals = {}
+    for user_id, search_value, patent_count, innovator_count in searches:
+        total = totals.setdefault(
+            user_id,
+            dict(
+                fields,
+                user_id=user_id,
+                search_count=0,
+                patent_count=0,
+                innovator_count=0,
+            ),
+        )
+        total["search_count"] += search_value is not None
+        total["patent_count"] += patent_count or 0
+        total["innovator_count"] += innovator_count or 0
+    return list(totals.values())
+
+
+class UserSearchCounterManager(models.Manager):
+    def add(self, searches):
+        """Count ``(user_id, search_value, patent_count, innovator_count)`` rows."""
+        upsert(
+            self.model,
+            search_totals(searches),
+            conflict_fields=["user_id"],
+            increment_fields=["search_count", "patent_count", "innovator_count"],
+            update_fields=["updated_at"],
+        )
+
+    def remove(self, searches):
+        """Take rows counted by :meth:`add` out of the counters again."""
+        for total in search_totals(searches):
+            self.filter(user_id=total["user_id"]).update(
+                search_count=F("search_count") - total["search_count"],
+                patent_count=F("patent_count") - total["patent_count"],
+                innovator_count=F("innovator_count") - total["innovator_count"],
+            )
+
+    def rebuild(self):
+        """Recompute every counter from the UserSearch table."""
+        totals = (
+            UserSearch.objects.filter(user_id__isnull=False)
+            .values("user_id")
+            .annotate(
+                searches=Count("search_value"),
+                patents=Sum("patent_count"),
+                innovators=Sum("innovator_count"),
+            )
+            .order_by()
+        )
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id_id=total["user_id"],
+                        search_count=total["searches"],
+                        patent_count=total["patents"] or 0,
+                        innovator_count=total["innovators"] or 0,
+                    )
+                    for total in totals.iterator()
+                ),
+                batch_size=500,
+            )
+        return self.count()
+
+
+class UserSearchCounter(models.Model):
+    """Dashboard totals of a user, kept up to date by UserSearch.objects.record_hits."""
+
+    user_id = models.OneToOneField(
+        APIUser, on_delete=models.CASCADE, related_name="search_counter"
+    )
+    search_count = models.IntegerField(default=0)
+    patent_count = models.BigIntegerField(default=0)
+    innovator_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserSearchCounterManager()
+
+
+class UserSearchDailyManager(models.Manager):
+    def add(self, searches, day):
+        """Count the rows of :func:`search_totals` created on ``day``."""
+        upsert(
+            self.model,
+            search_totals(searches, day=day),
+            conflict_fields=["user_id", "day"],
+            increment_fields=["search_count", "patent_count", "innovator_count"],
+            update_fields=["updated_at"],
+        )
+
+    def rebuild(self, start=None, end=None):
+        """Recompute the rollups of the days between ``start`` and ``end``."""
+        searches = UserSearch.objects.filter(user_id__isnull=False)
+        days = self.all()
+        if start:
+            searches = searches.filter(created_at__gte=start)
+            days = days.filter(day__gte=start)
+        if end:
+            searches = searches.filter(created_at__lt=end + timedelta(days=1))
+            days = days.filter(day__lte=end)
+        totals = (
+            searches.annotate(created_on=TruncDate("created_at"))
+            .values("user_id", "created_on")
+            .annotate(
+                searches=Count("search_value"),
+                patents=Sum("patent_count"),
+                innovators=Sum("innovator_count"),
+            )
+            .order_by()
+        )
+        with transaction.atomic(using=self.db):
+            days.delete()
+            created = self.bulk_create(
+                (
+                    self.model(
+                        user_id_id=total["user_id"],
+                        day=total["created_on"],
+                        search_count=total["searches"],
+                        patent_count=total["patents"] or 0,
+                        innovator_count=total["innovators"] or 0,
+                    )
+                    for total in totals.iterator()
+                ),
+                batch_size=500,
+            )
+        return len(created)
+
+
+class UserSearchDaily(models.Model):
+    """Searches a user started on ``day``, with the patents and innovators found."""
+
+    user_id = models.ForeignKey(APIUser, on_delete=models.CASCADE)
+    day = models.DateField()
+    search_count = models.IntegerField(default=0)
+    patent_count = models.BigIntegerField(default=0)
+    innovator_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserSearchDailyManager()
+
+    class Meta:
+        constraints = [
+            # also the index range queries run on, one row per user and day
+            models.UniqueConstraint(
+                fields=["user_id", "day"], name="unique_user_search_day"
+            )
+        ]
+
 
 class UserBookmark(models.Model):
     user_id = models.ForeignKey(
@@ -137,6 +472,9 @@ class UserBookmark(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "created_at"])]
+
 
 class UserNote(models.Model):
     user_id = models.ForeignKey(
@@ -146,6 +484,9 @@ class UserNote(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "created_at"])]
+
 
 class UserNotification(models.Model):
     user_id = models.ForeignKey(
@@ -155,6 +496,148 @@ class UserNotification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "created_at"])]
+
+
+class JobManager(models.Manager):
+    def enqueue(
+        self,
+        task,
+        args=(),
+        kwargs=None,
+        queue="default",
+        run_at=None,
+        max_attempts=None,
+    ):
+        """Store a call of ``task``, the dotted path of a function, for run_jobs.
+
+        ``args`` and ``kwargs`` must be JSON serializable.
+        """
+        import_string(task)
+        return self.create(
+            queue=queue,
+            task=task,
+            payload=json.dumps({"args": list(args), "kwargs": kwargs or {}}),
+            run_at=run_at or datetime.now(),
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+
+    def claim(self, queue, limit, worker):
+        """Mark up to ``limit`` due jobs of ``queue`` running for ``worker``.
+
+        Jobs locked by another worker's claim are skipped, not waited for.
+        Databases without SKIP LOCKED (SQLite) give a job to the claim whose
+        conditional update changes its status first.
+        """
+        now = datetime.now()
+        due = self.filter(queue=queue, status=Job.QUEUED, run_at__lte=now).order_by(
+            "run_at", "pk"
+        )
+        running = dict(
+            status=Job.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_at=now,
+            locked_by=worker,
+            updated_at=now,
+        )
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=self.db):
+                pks = list(
+                    due.select_for_update(skip_locked=True).values_list(
+                        "pk", flat=True
+                    )[:limit]
+                )
+                self.filter(pk__in=pks).update(**running)
+        else:
+            pks = [
+                pk
+                for pk in due.values_list("pk", flat=True)[:limit]
+                if self.filter(pk=pk, status=Job.QUEUED).update(**running)
+            ]
+        return list(self.filter(pk__in=pks).order_by("run_at", "pk"))
+
+    def release_stale(self, timeout):
+        """Requeue jobs running for more than ``timeout`` seconds.
+
+        Their worker is assumed dead, a job that used up its attempts fails.
+        """
+        stale = self.filter(
+            status=Job.RUNNING,
+            locked_at__lt=datetime.now() - timedelta(seconds=timeout),
+        )
+        unlocked = dict(locked_at=None, locked_by=None, updated_at=datetime.now())
+        failed = stale.filter(attempts__gte=F("max_attempts")).update(
+            status=Job.FAILED, last_error="worker lost", **unlocked
+        )
+        return failed + stale.update(status=Job.QUEUED, **unlocked)
+
+
+class Job(models.Model):
+    """A function call run in the background by ``python manage.py run_jobs``."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    ]
+
+    queue = models.CharField(max_length=50, default="default")
+    task = models.CharField(max_length=200)
+    payload = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=1)
+    run_at = models.DateTimeField(default=datetime.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = JobManager()
+
+    class Meta:
+        indexes = [
+            # due jobs of a queue, in claim order
+            models.Index(fields=["queue", "status", "run_at"]),
+            models.Index(fields=["status", "locked_at"]),
+        ]
+
+    def run(self):
+        payload = json.loads(self.payload)
+        return import_string(self.task)(*payload["args"], **payload["kwargs"])
+
+    def finish(self):
+        self._release(status=Job.DONE)
+
+    def retry_or_fail(self, error):
+        """Run again after a backoff doubling per attempt, or fail for good."""
+        if self.attempts >= self.max_attempts:
+            self._release(status=Job.FAILED, last_error=str(error))
+            return False
+        delay = min(
+            settings.JOB_RETRY_BACKOFF * 2 ** (self.attempts - 1),
+            settings.JOB_RETRY_MAX_DELAY,
+        )
+        self._release(
+            status=Job.QUEUED,
+            run_at=datetime.now() + timedelta(seconds=delay),
+            last_error=str(error),
+        )
+        return True
+
+    def _release(self, **fields):
+        # a job requeued by release_stale in the meantime belongs to its new run
+        Job.objects.filter(
+            pk=self.pk, status=Job.RUNNING, locked_by=self.locked_by
+        ).update(locked_at=None, locked_by=None, updated_at=datetime.now(), **fields)
+
 
 # class Patent(models.Model):
 #     user_id = models.ForeignKey(
@@ -1,3 +1,1412 @@
-from django.test import TestCase
+import json
+import smtplib
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from threading import Barrier, Lock, Thread
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import requests
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from jwt_utils.token_digest import token_digest
+from jwt_utils.token_session import create_session, rotate_session
+from users.models import (
+    Job,
+    SearchResult,
+    Token,
+    UserBookmark,
+    UserNote,
+    UserNotification,
+    UserSearch,
+    UserSearchCounter,
+    UserSearchDaily,
+)
+from users.serializers import (
+    UserBookmarkSerializer,
+    UserNotesSerializer,
+    UserNotificationsSerializer,
+    UserSearchSerializer,
+    UserSerializer,
+)
+from utils.circuit_breaker import crawler_breaker
+from utils.crawler_cache import CrawlerCache, crawler_cache
+from utils.crawler_client import CrawlerClient, crawler_client
+from utils.mail_utils import MailDispatcher, mail_dispatcher
+from utils.renderers import ORJSONRenderer, msgpack
+from utils.search_hit_buffer import SearchHitBuffer
+from utils.search_prefetch import SearchPrefetcher, search_prefetcher
+from utils.search_utils import (
+    ResultSummaryReader,
+    build_search_body,
+    record_searches,
+    search_summary,
+)
+from utils.serializer_utils import compile_serializer
+from utils.token_cache import TokenCache, token_cache
+from utils.token_denylist import TokenDenylist, token_denylist
+from web_crawler import settings
+
+PASSWORD = "passw0rd!"
+
+
+def create_user(email="user@example.com"):
+    return get_user_model().objects.create_user(
+        {"email": email, "password": PASSWORD, "first_name": "Test"}
+    )
+
+
+def login(client, email="user@example.com"):
+    response = client.post(
+        "/user/login", {"email": email, "password": PASSWORD}, format="json"
+    )
+    return response.data
+
+
+class CrawlerStub:
+    """Local crawler answering fetch/records, ``faults`` are (status, delay) pairs
+    used for the next requests before it answers normally."""
+
+    def __init__(self):
+        self.calls = 0
+        self.faults = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.calls += 1
+                status, delay = stub.faults.pop(0) if stub.faults else (200, 0)
+                time.sleep(delay)
+                data = json.dumps(stub.payload(body)).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        # clients that timed out leave broken pipes behind
+        self.server.handle_error = lambda request, address: None
+        self.url = "http://127.0.0.1:%d/" % self.server.server_port
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def payload(body):
+        return {
+            "result": {
+                "search_id": "search-%s-%s" % (body["query"], body.get("skip", 0)),
+                "patents": {"total_count": 3, "id": "P1,P2,P3", "name": "patents"},
+                "innovators": {"total_count": 2, "id": "I1,I2", "name": "innovators"},
+            }
+        }
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CrawlerClientTests(TestCase):
+    def setUp(self):
+        self.stub = CrawlerStub()
+        self.addCleanup(self.stub.stop)
+
+    def test_retries_unavailable_crawler(self):
+        client = CrawlerClient(self.stub.url, backoff_factor=0)
+        self.stub.faults = [(503, 0), (503, 0)]
+        result = client.fetch_records({"query": "aspirin"})
+        self.assertEqual(result["result"]["search_id"], "search-aspirin-0")
+        self.assertEqual(self.stub.calls, 3)
+
+    def test_read_timeout(self):
+        client = CrawlerClient(self.stub.url, read_timeout=0.1, retries=0)
+        self.stub.faults = [(200, 0.5)]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.fetch_records({"query": "aspirin"})
+
+
+class CrawlerCacheTests(TestCase):
+    def test_concurrent_misses_are_coalesced(self):
+        cache = CrawlerCache(max_size=10, ttl=60)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"result": {}}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(
+                executor.map(lambda _: cache.get_or_fetch("key", fetch), range(5))
+            )
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"result": {}}] * 5)
+        self.assertEqual(cache.stats()["coalesced"], 4)
+
+    def test_errors_are_shared_and_not_cached(self):
+        cache = CrawlerCache(max_size=10, ttl=60)
+
+        def fail():
+            raise ValueError("crawler down")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_fetch("key", fail)
+        self.assertEqual(cache.get_or_fetch("key", lambda: 1), 1)
+
+    def test_entries_expire(self):
+        cache = CrawlerCache(max_size=10, ttl=0)
+        cache.set("key", 1)
+        self.assertIsNone(cache.get("key"))
+
+
+class CrawlerTestCase(TestCase):
+    """Logged in client with the crawler client pointed at a local stub."""
+
+    def setUp(self):
+        cache.clear()
+        crawler_cache.clear()
+        crawler_breaker.reset()
+        search_prefetcher.reset()
+        token_denylist.clear()
+        self.stub = CrawlerStub()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch.object(crawler_client, "base_url", self.stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = create_user()
+        self.client = APIClient()
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+
+    def search(self, search_value="aspirin", **data):
+        data["search_value"] = search_value
+        return self.client.post("/user/platform-search", data, format="json")
+
+
+class PlatformSearchTests(CrawlerTestCase):
+    def test_cache_hit_still_records_search(self):
+        self.search()
+        response = self.search()
+        self.assertEqual(response.data["results"]["search_id"], "search-aspirin-0")
+        self.assertEqual(self.stub.calls, 1)
+        self.assertEqual(UserSearch.objects.get().search_count, 2)
+
+    def test_page_is_clamped(self):
+        with mock.patch.object(settings, "CRAWLER_MAX_PAGE_SIZE", 50):
+            body = build_search_body({"search_value": "aspirin", "index": -5}, 10 ** 6)
+            self.assertEqual((body["skip"], body["top"]), (0, 50))
+            self.assertEqual(build_search_body({}, "0")["top"], 1)
+        response = self.search(index=-5, limit=10 ** 6)
+        self.assertEqual(response.data["results"]["search_id"], "search-aspirin-0")
+
+
+class CrawlerGuardTests(CrawlerTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(crawler_breaker, "failure_threshold", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        self.stub.faults = [(500, 0), (500, 0)]
+        self.assertEqual(self.search("a").data["code"], 114)
+        self.assertEqual(self.search("b").data["code"], 114)
+        self.assertEqual(self.search("c").data["code"], 114)
+        self.assertEqual(self.stub.calls, 2)
+        stats = crawler_breaker.stats()
+        self.assertEqual(
+            (stats["state"], stats["trips"], stats["rejected"]), ("open", 1, 1)
+        )
+
+    def test_trial_call_closes_the_breaker(self):
+        self.stub.faults = [(500, 0), (500, 0)]
+        self.search("a")
+        self.search("b")
+        with mock.patch.object(crawler_breaker, "reset_timeout", 0):
+            self.assertEqual(self.search("c").data["code"], 200)
+        self.assertEqual(crawler_breaker.stats()["state"], "closed")
+
+    def test_client_errors_do_not_count(self):
+        self.stub.faults = [(400, 0), (400, 0), (400, 0)]
+        for query in "abc":
+            self.search(query)
+        self.assertEqual(self.stub.calls, 3)
+        self.assertEqual(crawler_breaker.stats()["state"], "closed")
+
+    def test_deadline(self):
+        self.stub.faults = [(200, 1)]
+        start = time.monotonic()
+        with mock.patch.object(settings, "CRAWLER_DEADLINE", 0.2):
+            response = self.search()
+        self.assertEqual(response.data["code"], 114)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(crawler_breaker.stats()["failures"], 1)
+
+    def test_stale_result_while_crawler_fails(self):
+        fresh = self.search().data
+        self.assertFalse(fresh["stale"])
+        self.stub.faults = [(500, 0)]
+        with mock.patch.object(crawler_cache, "ttl", 0):
+            response = self.search()
+        self.assertEqual(response.data["code"], 200)
+        self.assertTrue(response.data["stale"])
+        self.assertEqual(response.data["results"], fresh["results"])
+        self.assertEqual(crawler_cache.stats()["stale_hits"], 1)
+
+    def test_status_for_admins_only(self):
+        self.assertEqual(self.client.get("/user/crawler-status").status_code, 403)
+        admin = create_user("admin@example.com")
+        admin.is_superuser = True
+        admin.save()
+        client = APIClient()
+        tokens = login(client, "admin@example.com")
+        client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+        results = client.get("/user/crawler-status").data["results"]
+        self.assertEqual(results["breaker"]["state"], "closed")
+        self.assertIn("stale_hits", results["cache"])
+
+
+class SearchPrefetchTests(CrawlerTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(settings, "CRAWLER_PREFETCH", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_prefetches(self):
+        for _ in range(100):
+            if not search_prefetcher.stats()["in_flight"]:
+                return
+            time.sleep(0.02)
+        self.fail("prefetch did not finish")
+
+    def test_next_page_is_served_from_the_prefetch(self):
+        self.search(index=0, limit=1)
+        self.wait_for_prefetches()
+        self.assertEqual(self.stub.calls, 2)
+        response = self.search(index="1", limit="1")
+        self.assertEqual(response.data["results"]["search_id"], "search-aspirin-1")
+        self.wait_for_prefetches()
+        # pages 1 and 2 were prefetched, page 1 was asked for
+        self.assertEqual(self.stub.calls, 3)
+        stats = search_prefetcher.stats()
+        self.assertEqual((stats["fetched"], stats["hits"]), (2, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_no_prefetch_after_the_last_page(self):
+        # the stub reports 3 patents and 2 innovators
+        self.search(index=2, limit=1)
+        self.assertEqual(search_prefetcher.stats()["scheduled"], 0)
+
+    def test_prefetches_are_capped_per_user(self):
+        self.stub.faults = [(200, 0.3)]
+        prefetcher = SearchPrefetcher(max_in_flight=2, max_per_user=1)
+        body = build_search_body({"search_value": "aspirin"})
+        self.assertTrue(prefetcher.prefetch(1, body))
+        self.assertFalse(prefetcher.prefetch(1, dict(body, skip=10)))
+        self.assertTrue(prefetcher.prefetch(2, dict(body, skip=20)))
+        self.assertFalse(prefetcher.prefetch(3, dict(body, skip=30)))
+        self.assertEqual(prefetcher.stats()["skipped"], 2)
+
+    def test_prefetches_are_held_to_the_deadline(self):
+        self.stub.faults = [(200, 1)]
+        prefetcher = SearchPrefetcher(max_in_flight=1, max_per_user=1)
+        body = build_search_body({"search_value": "aspirin"})
+        with mock.patch.object(settings, "CRAWLER_DEADLINE", 0.2):
+            self.assertTrue(prefetcher.prefetch(1, body))
+            time.sleep(0.5)
+        self.assertEqual(prefetcher.stats()["failed"], 1)
+
+    def test_no_prefetch_while_the_breaker_is_open(self):
+        prefetcher = SearchPrefetcher(max_in_flight=1, max_per_user=1)
+        body = build_search_body({"search_value": "aspirin"})
+        with mock.patch.object(crawler_breaker, "state", "open"):
+            self.assertFalse(prefetcher.prefetch(1, body))
+        self.assertEqual(self.stub.calls, 0)
+
+
+class MonitoringTests(CrawlerTestCase):
+    def monitor(self, user, search_value, patent_count, innovator_count=2):
+        UserSearch.objects.create(
+            user_id=user,
+            search_value=search_value,
+            search_result_id="search-%s" % search_value,
+            patent_count=patent_count,
+            innovator_count=innovator_count,
+            needs_monitoring=True,
+        )
+
+    def run_cycle(self, *args):
+        out = StringIO()
+        call_command("run_monitoring", "--once", *args, stdout=out)
+        return out.getvalue()
+
+    def test_changed_counts_notify_each_owner_once(self):
+        other = create_user("other@example.com")
+        # the stub answers 3 patents and 2 innovators for every query
+        self.monitor(self.user, "aspirin", 1)
+        self.monitor(other, "aspirin", 1)
+        self.monitor(other, "ibuprofen", 3)
+        UserSearch.objects.create(user_id=other, search_value="x", patent_count=0)
+
+        self.assertIn("2 queries, 0 failed, 2 notifications", self.run_cycle())
+        self.assertEqual(self.stub.calls, 2)
+        self.assertEqual(
+            sorted(UserNotification.objects.values_list("user_id", flat=True)),
+            sorted([self.user.id, other.id]),
+        )
+        self.assertEqual(
+            set(
+                UserSearch.objects.filter(search_value="aspirin").values_list(
+                    "patent_count", "monitored_patent_count"
+                )
+            ),
+            {(1, 3)},
+        )
+
+        self.assertIn("0 notifications", self.run_cycle())
+        self.assertEqual(UserNotification.objects.count(), 2)
+
+    def test_unchanged_results_are_skipped_by_hash(self):
+        self.monitor(self.user, "aspirin", 3)
+        self.assertIn("0 notifications, 0 unchanged", self.run_cycle())
+        snapshot = SearchResult.objects.get()
+        self.assertEqual(
+            (snapshot.search_result_id, snapshot.patent_id),
+            ("search-aspirin-0", "P1,P2,P3"),
+        )
+
+        # same counts, one patent replaced by another
+        payload = CrawlerStub.payload({"query": "aspirin"})
+        payload["result"]["patents"]["id"] = "P1,P3,P4"
+        self.stub.payload = lambda body: payload
+        self.assertIn("1 notifications, 0 unchanged", self.run_cycle())
+        self.assertEqual(
+            UserNotification.objects.get().notification_text,
+            'New results for "aspirin": 3 patents (was 3), 2 innovators (was 2)'
+            "; new patents: P4",
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn("0 notifications, 1 unchanged", self.run_cycle())
+        self.assertFalse([q for q in queries if "monitored_patent_count" in q["sql"]])
+        self.assertEqual(SearchResult.objects.get().patent_id, "P1,P3,P4")
+
+    def test_failed_notification_is_retried(self):
+        self.monitor(self.user, "aspirin", 1)
+        with mock.patch(
+            "utils.monitoring.notify_changes", side_effect=OperationalError("locked")
+        ):
+            self.assertIn("1 failed, 0 notifications", self.run_cycle())
+        self.assertFalse(SearchResult.objects.exists())
+        self.assertIn("0 failed, 1 notifications", self.run_cycle())
+        self.assertEqual(UserNotification.objects.count(), 1)
+
+    def test_values_are_walked_in_chunks(self):
+        for number in range(5):
+            self.monitor(self.user, "query %d" % number, 3)
+        self.stub.faults = [(500, 0)]
+        self.assertIn("5 queries, 1 failed", self.run_cycle("--chunk-size", "2"))
+        self.assertEqual(self.stub.calls, 5)
+
+
+class StreamingSearchTests(CrawlerTestCase):
+    def stream(self, search_value="aspirin"):
+        return self.client.post(
+            "/user/platform-search?stream=1",
+            {"search_value": search_value},
+            format="json",
+        )
+
+    def test_body_is_passed_through_and_recorded(self):
+        response = self.stream()
+        self.assertFalse(UserSearch.objects.exists())
+        body = b"".join(response.streaming_content)
+        expected = CrawlerStub.payload({"query": "aspirin"})
+        self.assertEqual(body, json.dumps(expected).encode())
+        search = UserSearch.objects.get()
+        self.assertEqual(
+            (search.search_result_id, search.patent_count, search.result.innovator_id),
+            ("search-aspirin-0", 3, "I1,I2"),
+        )
+
+    def test_upstream_error(self):
+        self.stub.faults = [(500, 0)]
+        self.assertEqual(self.stream().data["code"], 114)
+
+    def test_deadline(self):
+        self.stub.faults = [(200, 1)]
+        start = time.monotonic()
+        with mock.patch.object(settings, "CRAWLER_DEADLINE", 0.2):
+            response = self.stream()
+        self.assertEqual(response.data["code"], 114)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(crawler_breaker.stats()["failures"], 1)
+
+    def test_reader_keeps_only_summary_fields(self):
+        payload = CrawlerStub.payload({"query": "aspirin"})
+        expected = json.loads(json.dumps(payload["result"]))
+        payload["result"]["patents"]["records"] = [{"id": "P1", "total_count": 9}]
+        data = json.dumps(payload).encode()
+        reader = ResultSummaryReader()
+        for start in range(0, len(data), 7):
+            reader.feed(data[start : start + 7])
+        self.assertEqual(reader.close(), expected)
+
+        reader = ResultSummaryReader()
+        reader.feed(b'{"result": {"search_id": ')
+        self.assertIsNone(reader.close())
+
+
+class RecordSearchesTests(TestCase):
+    def test_hits_are_upserted_in_one_statement(self):
+        user = create_user()
+        result = CrawlerStub.payload({"query": "aspirin"})["result"]
+        record_searches(user, [("aspirin", "platform", result)])
+        with CaptureQueriesContext(connection) as queries:
+            record_searches(user, [("aspirin", "platform", result)] * 2)
+        writes = [q["sql"] for q in queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len([sql for sql in writes if "users_usersearch" in sql]), 1)
+        search = UserSearch.objects.get()
+        self.assertEqual(search.search_count, 3)
+        self.assertEqual(search.patent_count, 3)
+
+    def test_users_share_one_result(self):
+        result = CrawlerStub.payload({"query": "aspirin"})["result"]
+        users = [create_user("%d@example.com" % number) for number in range(2)]
+        for user in users:
+            record_searches(user, [("aspirin", "platform", result)])
+        # a later, different answer for the same id doesn't replace the stored one
+        changed = dict(result, patents=dict(result["patents"], name="changed"))
+        record_searches(users[0], [("aspirin", "platform", changed)])
+
+        shared = SearchResult.objects.get()
+        self.assertEqual(
+            (shared.search_result_id, shared.patent_id, shared.patent_name),
+            ("search-aspirin-0", "P1,P2,P3", "patents"),
+        )
+        self.assertEqual(
+            set(UserSearch.objects.values_list("result", "search_count")),
+            {(shared.pk, 2), (shared.pk, 1)},
+        )
+
+
+class DashboardCountTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=login(self.client)["access_token"])
+
+    def record(self, query):
+        result = CrawlerStub.payload({"query": query})["result"]
+        record_searches(self.user, [(query, "platform", result)])
+
+    def test_counters_follow_new_searches_only(self):
+        self.record("aspirin")
+        self.record("aspirin")
+        self.record("ibuprofen")
+        counter = UserSearchCounter.objects.get(user_id=self.user)
+        self.assertEqual(
+            (counter.search_count, counter.patent_count, counter.innovator_count),
+            (2, 6, 4),
+        )
+
+    def test_hits_in_the_same_instant_are_counted_once(self):
+        now = datetime.now().replace(microsecond=0)
+        with mock.patch("users.models.datetime") as clock:
+            clock.now.return_value = now
+            self.record("aspirin")
+            self.record("aspirin")
+        counter = UserSearchCounter.objects.get(user_id=self.user)
+        self.assertEqual((counter.search_count, counter.patent_count), (1, 3))
+
+    def test_all_counts_in_one_request(self):
+        self.record("aspirin")
+        response = self.client.get("/user/dashboard-count", {"key": "all"})
+        self.assertEqual(
+            response.data["results"], {"api": 1, "patent": 3, "innovator": 2}
+        )
+        response = self.client.get("/user/dashboard-count", {"key": "patent"})
+        self.assertEqual(response.data["results"], {"patent": 3})
+
+    def test_rebuild_matches_incremental_counters(self):
+        self.record("aspirin")
+        self.record("ibuprofen")
+        expected = list(UserSearchCounter.objects.values_list(
+            "user_id", "search_count", "patent_count", "innovator_count"
+        ))
+        UserSearchCounter.objects.all().delete()
+        call_command("rebuild_search_counters", stdout=StringIO())
+        self.assertEqual(
+            list(UserSearchCounter.objects.values_list(
+                "user_id", "search_count", "patent_count", "innovator_count"
+            )),
+            expected,
+        )
+
+
+class DashboardTimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=login(self.client)["access_token"])
+
+    def record(self, query):
+        result = CrawlerStub.payload({"query": query})["result"]
+        record_searches(self.user, [(query, "platform", result)])
+
+    def test_days_are_rolled_up_as_searches_are_recorded(self):
+        self.record("aspirin")
+        self.record("aspirin")
+        self.record("ibuprofen")
+        today = datetime.now().date()
+        # the Token lookup of the process-local denylist and the rollups
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/user/dashboard-timeseries",
+                {"from": str(today - timedelta(days=2)), "to": str(today)},
+            )
+        results = response.data["results"]
+        self.assertEqual([day["api"] for day in results], [0, 0, 2])
+        self.assertEqual(
+            results[-1],
+            {"day": str(today), "api": 2, "patent": 6, "innovator": 4},
+        )
+
+    def test_invalid_range(self):
+        for params in ({"from": "2021-02-01", "to": "2021-01-01"}, {"to": "nope"}):
+            response = self.client.get("/user/dashboard-timeseries", params)
+            self.assertEqual(response.data["code"], 400)
+
+    def test_backfill_groups_searches_by_day(self):
+        self.record("aspirin")
+        self.record("ibuprofen")
+        UserSearch.objects.filter(search_value="aspirin").update(
+            created_at=datetime(2021, 1, 1, 23, 59)
+        )
+        UserSearchDaily.objects.all().delete()
+        call_command("backfill_search_rollups", stdout=StringIO())
+        self.assertEqual(
+            list(
+                UserSearchDaily.objects.order_by("day").values_list(
+                    "day", "search_count", "patent_count"
+                )
+            ),
+            [(date(2021, 1, 1), 1, 3), (datetime.now().date(), 1, 3)],
+        )
+        call_command(
+            "backfill_search_rollups", "--from", "2021-01-01", "--to", "2021-01-01",
+            stdout=StringIO(),
+        )
+        self.assertEqual(UserSearchDaily.objects.count(), 2)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN what the list endpoints run, full table scans and sorts fail."""
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "mysql"):
+            self.skipTest("no query plan checks for %s" % connection.vendor)
+        self.user = create_user()
+        other = create_user("other@example.com")
+        now = datetime.now()
+        for owner in (self.user, other):
+            UserSearch.objects.bulk_create(
+                UserSearch(
+                    user_id=owner,
+                    search_value="aspirin %d" % number,
+                    search_result_id="search-%d" % number,
+                    needs_monitoring=number % 2 == 0,
+                )
+                for number in range(50)
+            )
+            UserNote.objects.bulk_create(
+                UserNote(user_id=owner, note_text="note %d" % number)
+                for number in range(50)
+            )
+            UserNotification.objects.bulk_create(
+                UserNotification(user_id=owner, notification_text="hi %d" % number)
+                for number in range(50)
+            )
+            UserBookmark.objects.bulk_create(
+                UserBookmark(user_id=owner, content_id=number) for number in range(50)
+            )
+        self.today = str(now.date())
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=login(self.client)["access_token"])
+
+    def plan_problems(self, sql, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+                return [
+                    detail
+                    for detail in details
+                    if detail.startswith("SCAN " + table) or "TEMP B-TREE" in detail
+                ]
+            cursor.execute("EXPLAIN " + sql)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [
+                row
+                for row in rows
+                if row["table"] == table
+                and (row["type"] == "ALL" or "filesort" in (row["Extra"] or ""))
+            ]
+
+    def assert_indexed(self, queries, table):
+        quoted = connection.ops.quote_name(table)
+        statements = [
+            query["sql"]
+            for query in queries
+            if quoted in query["sql"]
+            and query["sql"].split()[0] in ("SELECT", "UPDATE", "DELETE")
+        ]
+        self.assertTrue(statements, "no query on %s" % table)
+        for sql in statements:
+            self.assertEqual(self.plan_problems(sql, table), [], sql)
+
+    def assert_endpoint_indexed(self, table, path, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assert_indexed(queries, table)
+
+    def test_search_history(self):
+        self.assert_endpoint_indexed("users_usersearch", "/user/user-search")
+        self.assert_endpoint_indexed(
+            "users_usersearch", "/user/user-search", {"search_value": "aspirin 1"}
+        )
+
+    def test_monitoring_list(self):
+        self.assert_endpoint_indexed("users_usersearch", "/user/monitory")
+
+    def test_monitoring_create(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(
+                "/user/monitory", {"search_value_id": "search-1"}, format="json"
+            )
+        self.assert_indexed(queries, "users_usersearch")
+
+    def test_notes_in_date_range(self):
+        self.assert_endpoint_indexed(
+            "users_usernote", "/user/user-note", {"from": self.today, "to": self.today}
+        )
+
+    def test_platform_search_lookup(self):
+        result = CrawlerStub.payload({"query": "aspirin"})["result"]
+        with CaptureQueriesContext(connection) as queries:
+            record_searches(self.user, [("aspirin", "platform", result)])
+        self.assert_indexed(queries, "users_usersearch")
+
+    def test_cursor_pages(self):
+        endpoints = [
+            ("users_usersearch", "/user/user-search"),
+            ("users_usersearch", "/user/monitory"),
+            ("users_usernote", "/user/user-note"),
+            ("users_usernotification", "/user/user-notification"),
+            ("users_userbookmark", "/user/user-bookmark"),
+        ]
+        for table, path in endpoints:
+            next_page = self.client.get(path, {"cursor": ""}).data["next"]
+            self.assert_endpoint_indexed(table, next_page)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        user = create_user()
+        UserNote.objects.bulk_create(
+            UserNote(user_id=user, note_text="note %d" % number) for number in range(40)
+        )
+        # a tie on created_at is broken by id
+        UserNote.objects.filter(id__in=[20, 21, 22]).update(
+            created_at=UserNote.objects.get(id=20).created_at
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=login(self.client)["access_token"])
+
+    def test_walks_every_row_once_without_counting(self):
+        expected = list(
+            UserNote.objects.order_by("-created_at", "-id").values_list(
+                "note_text", flat=True
+            )
+        )
+        seen = []
+        url = "/user/user-note?cursor="
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse([q for q in queries if "COUNT(" in q["sql"]])
+            self.assertNotIn("count", response.data)
+            seen.extend(note["note_text"] for note in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+    def test_previous_returns_the_page_before(self):
+        first = self.client.get("/user/user-note", {"cursor": ""}).data
+        second = self.client.get(first["next"]).data
+        self.assertEqual(self.client.get(second["previous"]).data, first)
+        self.assertIsNone(first["previous"])
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get("/user/user-note", {"page": 2})
+        self.assertEqual(response.data["count"], 40)
+        self.assertEqual(len(response.data["results"]), 15)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/user/user-note", {"cursor": "nope"})
+        self.assertEqual(response.status_code, 404)
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        UserSearch.objects.create(
+            user_id=self.user, search_value="aspirin", search_result_id="s-1"
+        )
+        UserSearch.objects.create(user_id=self.user, search_value=None)
+        UserNote.objects.create(user_id=self.user, note_text="note")
+        UserNotification.objects.create(user_id=self.user, notification_text=None)
+        UserBookmark.objects.create(user_id=self.user, content_id=7)
+
+    def test_same_output_as_the_serializer(self):
+        for model, serializer_class in (
+            (UserSearch, UserSearchSerializer),
+            (UserNote, UserNotesSerializer),
+            (UserNotification, UserNotificationsSerializer),
+            (UserBookmark, UserBookmarkSerializer),
+            (get_user_model(), UserSerializer),
+        ):
+            serializer = compile_serializer(serializer_class)
+            instances = model.objects.order_by("id")
+            rows = instances.values(*serializer.columns)
+            self.assertEqual(
+                json.dumps(serializer(rows)),
+                json.dumps(serializer_class(instances, many=True).data),
+            )
+
+    def test_list_fetches_only_serialized_columns(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=login(client)["access_token"])
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/user/user-search")
+        self.assertEqual(
+            response.data["results"][1],
+            {"search_value": "aspirin", "search_count": 0, "search_result_id": "s-1"},
+        )
+        selects = [q["sql"] for q in queries if "users_usersearch" in q["sql"]]
+        self.assertFalse([sql for sql in selects if "patent_name" in sql])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        user = create_user()
+        UserSearch.objects.create(user_id=user, search_value="a", search_result_id="1")
+        UserNote.objects.create(user_id=user, note_text="note")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=login(self.client)["access_token"])
+
+    def test_only_requested_columns_are_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/user/user-search", {"fields": "search_value"})
+        self.assertEqual(response.data["results"], [{"search_value": "a"}])
+        select = [q["sql"] for q in queries if "users_usersearch" in q["sql"]][-1]
+        self.assertNotIn("search_result_id", select)
+
+    def test_with_cursor_pages(self):
+        response = self.client.get(
+            "/user/user-note", {"fields": "id, note_text", "cursor": ""}
+        )
+        self.assertEqual(
+            response.data["results"],
+            [{"note_text": "note", "id": UserNote.objects.get().id}],
+        )
+
+    def test_unknown_field(self):
+        for fields in ("search_value,patent_name", ","):
+            response = self.client.get("/user/user-search", {"fields": fields})
+            self.assertEqual(response.data["code"], 400)
+
+
+class RendererTests(TestCase):
+    def test_same_bytes_as_drf_json(self):
+        data = {
+            "results": CrawlerStub.payload({"query": "aspirin ß"})["result"],
+            "created_at": datetime(2021, 1, 2, 3, 4, 5, 6000),
+            "day": date(2021, 1, 2),
+            "count": Decimal("1.5"),
+            "id": uuid.UUID(int=1),
+            "empty": None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_same_bytes_as_drf_json_for_edge_cases(self):
+        for data in (
+            {"text": "line\u2028separator\u2029paragraph"},
+            {"count": 2 ** 64, "negative": -(2 ** 63) - 1},
+            {"nested": [{"empty": None, "ratio": 0.5}]},
+        ):
+            self.assertEqual(
+                ORJSONRenderer().render(data), JSONRenderer().render(data)
+            )
+        for value in (float("nan"), float("inf"), float("-inf")):
+            data = {"results": [{"empty": None, "ratio": value}]}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render(data)
+
+    def test_message_pack_by_accept_header(self):
+        if msgpack is None:
+            self.skipTest("msgpack is not installed")
+        create_user()
+        client = APIClient()
+        tokens = msgpack.unpackb(
+            client.post(
+                "/user/login",
+                msgpack.packb({"email": "user@example.com", "password": PASSWORD}),
+                content_type="application/msgpack",
+                HTTP_ACCEPT="application/msgpack",
+            ).content
+        )
+        self.assertIn("access_token", tokens)
+        response = client.get(
+            "/user/user-note",
+            HTTP_AUTHORIZATION=tokens["access_token"],
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content)["count"], 0)
+
+
+class SearchHitBufferTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        result = CrawlerStub.payload({"query": "aspirin"})["result"]
+        self.row = dict(search_summary(result), user_id=self.user, search_count=1)
+
+    def test_flushes_when_full(self):
+        buffer = SearchHitBuffer(max_pending=3)
+        buffer.add([self.row])
+        buffer.add([self.row])
+        self.assertFalse(UserSearch.objects.exists())
+        buffer.add([self.row])
+        self.assertEqual(UserSearch.objects.get().search_count, 3)
+        self.assertEqual(buffer.pending, 0)
+
+    def test_crash_loses_at_most_one_buffer(self):
+        max_pending = 5
+        worst = 0
+        for hits in range(1, 13):
+            UserSearch.objects.all().delete()
+            buffer = SearchHitBuffer(max_pending)
+            for _ in range(hits):
+                buffer.add([self.row])
+            # the process dies here, whatever is still buffered is gone
+            stored = UserSearch.objects.values_list("search_count", flat=True)
+            lost = hits - sum(stored)
+            # full buffers were written, the hits since the last one were not
+            self.assertEqual(lost, hits % max_pending)
+            worst = max(worst, lost)
+        self.assertEqual(worst, max_pending - 1)
+
+    def test_failed_flushes_retain_a_bounded_number_of_hits(self):
+        buffer = SearchHitBuffer(max_pending=2, max_retained=5, retry_delay=60)
+        record_hits = mock.Mock(side_effect=OperationalError("database is down"))
+        with mock.patch.object(UserSearch.objects, "record_hits", record_hits):
+            for _ in range(7):
+                buffer.add([self.row])
+        # one attempt, the adds after it wait for retry_delay
+        self.assertEqual(record_hits.call_count, 1)
+        self.assertEqual((buffer.pending, buffer.dropped), (5, 2))
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(UserSearch.objects.get().search_count, 5)
+
+    def test_write_behind_setting(self):
+        result = CrawlerStub.payload({"query": "aspirin"})["result"]
+        buffer = SearchHitBuffer(max_pending=2)
+        with mock.patch.object(settings, "SEARCH_HIT_WRITE_BEHIND", True):
+            with mock.patch("utils.search_utils.search_hit_buffer", buffer):
+                record_searches(self.user, [("aspirin", "platform", result)])
+                self.assertFalse(UserSearch.objects.exists())
+                record_searches(self.user, [("aspirin", "platform", result)])
+        self.assertEqual(UserSearch.objects.get().search_count, 2)
+
+
+class PlatformSearchBatchTests(CrawlerTestCase):
+    def test_queries_run_concurrently(self):
+        self.stub.faults = [(200, 0.3)] * 5
+        queries = [{"search_value": "term%d" % i} for i in range(5)]
+        queries.append({"search_value": "term0"})
+        queries.append({"search_value": ""})
+        start = time.perf_counter()
+        response = self.client.post(
+            "/user/platform-search-batch", {"queries": queries}, format="json"
+        )
+        self.assertLess(time.perf_counter() - start, 1.0)
+        codes = [result["code"] for result in response.data["results"]]
+        self.assertEqual(codes, [200] * 6 + [306])
+        self.assertEqual(UserSearch.objects.count(), 5)
+        self.assertEqual(
+            UserSearch.objects.get(search_value="term0").search_count, 2
+        )
+
+    def test_failed_query_is_reported(self):
+        self.stub.faults = [(500, 0)]
+        response = self.client.post(
+            "/user/platform-search-batch",
+            {"queries": [{"search_value": "term"}]},
+            format="json",
+        )
+        self.assertEqual(response.data["results"][0]["code"], 114)
+        self.assertFalse(UserSearch.objects.exists())
+
+
+class TokenCacheTests(TestCase):
+    def test_entry_expires_with_token(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("token", {"user_id": 1, "exp": time.time() - 1})
+        self.assertIsNone(cache.get("token"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set("a", {"user_id": 1})
+        cache.set("b", {"user_id": 1})
+        cache.get("a")
+        cache.set("c", {"user_id": 2})
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_invalidate_user(self):
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("a", {"user_id": 1})
+        cache.set("b", {"user_id": 2})
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TokenDigestTests(TestCase):
+    def test_save_stores_digests(self):
+        token = Token.objects.create(access_token="access", refresh_token="refresh")
+        self.assertEqual(token.access_token_digest, token_digest("access"))
+        self.assertEqual(token.refresh_token_digest, token_digest("refresh"))
+        self.assertEqual(len(token.access_token_digest), 64)
+
+
+class TokenDenylistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_revocation_is_shared_through_cache(self):
+        TokenDenylist("default").revoke("abc", time.time() + 60)
+        other_worker = TokenDenylist("default")
+        self.assertTrue(other_worker.is_revoked("abc"))
+        self.assertFalse(other_worker.is_revoked("def"))
+
+    def test_rebuilt_from_database(self):
+        Token.objects.create(
+            access_jti="abc",
+            refresh_jti="def",
+            expires_at=datetime.now() + timedelta(minutes=5),
+            is_expired=True,
+        )
+        Token.objects.create(
+            access_jti="old",
+            expires_at=datetime.now() - timedelta(minutes=5),
+            is_expired=True,
+        )
+        denylist = TokenDenylist("default")
+        denylist.load()
+        self.assertEqual(len(denylist), 2)
+        self.assertTrue(denylist.is_revoked("def"))
+        self.assertFalse(denylist.is_revoked("old"))
+
+
+class JwtTokensAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        token_denylist.clear()
+        self.user = create_user()
+        self.client = APIClient()
+
+    def test_authentication_skips_database(self):
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+        shared = mock.PropertyMock(return_value=True)
+        with mock.patch.object(TokenDenylist, "shared", shared):
+            self.client.get("/user/user-note")
+            with self.assertNumQueries(1):
+                # only the pagination count, no Token lookup
+                response = self.client.get("/user/user-note")
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_token_is_rejected(self):
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["refresh_token"])
+        response = self.client.get("/user/user-note")
+        self.assertEqual(response.status_code, 403)
+
+    def test_process_local_denylist_checks_database(self):
+        self.assertFalse(token_denylist.shared)
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+        self.assertEqual(self.client.get("/user/user-note").status_code, 200)
+        # revoked by another worker, this process' denylist never heard of it
+        Token.objects.update(is_expired=True)
+        self.assertEqual(self.client.get("/user/user-note").status_code, 403)
+
+    def test_token_without_jti_uses_cache(self):
+        access_token = jwt.encode(
+            {"user_id": self.user.id, "type": "access", "exp": time.time() + 60},
+            settings.JWT_SECRET,
+            "HS256",
+        ).decode()
+        Token.objects.create(user_id=self.user, access_token=access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=access_token)
+        self.client.get("/user/user-note")
+        with self.assertNumQueries(1):
+            response = self.client.get("/user/user-note")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_cache.stats()["hits"], 1)
+
+    def test_logout_revokes_token(self):
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+        self.client.get("/user/user-note")
+        self.client.post("/user/logout")
+        response = self.client.get("/user/user-note")
+        self.assertEqual(response.status_code, 403)
+
+    def test_login_revokes_previous_session(self):
+        tokens = login(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=tokens["access_token"])
+        self.client.get("/user/user-note")
+        login(APIClient())
+        response = self.client.get("/user/user-note")
+        self.assertEqual(response.status_code, 403)
+
+
+class SessionRotationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        token_denylist.clear()
+        self.user = create_user()
+
+    def test_login_only_touches_active_session(self):
+        create_session(self.user)
+        create_session(self.user)
+        rotate_session(self.user)
+        self.assertEqual(Token.objects.filter(is_expired=False).count(), 1)
+        self.assertEqual(Token.objects.count(), 3)
+
+    def test_rotation_only_denies_the_sessions_it_expires(self):
+        create_session(self.user)
+        rotate_session(self.user)
+        with mock.patch.object(token_denylist, "revoke") as revoke:
+            rotate_session(self.user)
+        self.assertEqual(revoke.call_count, 2)
+
+    def test_parallel_refreshes_have_one_winner(self):
+        _, refresh_token = create_session(self.user)
+        workers = 8
+        barrier = Barrier(workers)
+
+        def refresh():
+            barrier.wait()
+            try:
+                for attempt in range(100):
+                    try:
+                        return rotate_session(self.user, refresh_token)
+                    except OperationalError as ex:
+                        # the in-memory sqlite test db fails instead of waiting
+                        # on the lock, the rolled back caller tries again
+                        if "locked" not in str(ex) or attempt == 99:
+                            raise
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda _: refresh(), range(workers)))
+
+        winners = [tokens for tokens in results if tokens is not None]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(results.count(None), workers - 1)
+        self.assertEqual(Token.objects.filter(is_expired=False).count(), 1)
+        self.assertIsNone(rotate_session(self.user, refresh_token))
+
+
+class MailDispatcherTests(TestCase):
+    params = {
+        "html": "users/reset_password_email.html",
+        "subject": "Reset Password Link",
+        "first_name": "Test",
+        "reset_url": "http://localhost:8000/?token=x",
+    }
+
+    def test_reset_mail_is_queued(self):
+        create_user()
+        response = APIClient().post(
+            "/user/forgot-password", {"email": "user@example.com"}, format="json"
+        )
+        self.assertEqual(response.data["code"], 200)
+        mail_dispatcher.join()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["user@example.com"])
+        html_message, _ = mail.outbox[0].alternatives[0]
+        self.assertIn("http://localhost:8000/?token=", html_message)
+
+    def test_one_connection_for_consecutive_batches(self):
+        dispatcher = MailDispatcher(
+            workers=1, batch_size=2, max_queue=10, idle_timeout=5
+        )
+        for number in range(5):
+            self.assertTrue(dispatcher.send("%d@example.com" % number, self.params))
+        dispatcher.join()
+        stats = dispatcher.stats()
+        self.assertEqual((stats["sent"], stats["connections"]), (5, 1))
+        self.assertGreaterEqual(stats["batches"], 3)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_mail_does_not_fail_the_batch(self):
+        send_messages = EmailBackend.send_messages
+        errors = [smtplib.SMTPServerDisconnected("idle connection closed")]
+
+        def flaky_send_messages(backend, messages):
+            if errors:
+                raise errors.pop()
+            if messages[0].to == ["bad@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({})
+            return send_messages(backend, messages)
+
+        dispatcher = MailDispatcher(
+            workers=1, batch_size=4, max_queue=10, idle_timeout=5
+        )
+        with mock.patch.object(EmailBackend, "send_messages", flaky_send_messages):
+            for email in ("a", "bad", "b", "c"):
+                dispatcher.send("%s@example.com" % email, self.params)
+            dispatcher.join()
+        stats = dispatcher.stats()
+        self.assertEqual((stats["sent"], stats["failed"]), (3, 1))
+        self.assertEqual(stats["connections"], 2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["a@example.com", "b@example.com", "c@example.com"],
+        )
+
+    def test_full_queue_refuses_mail(self):
+        dispatcher = MailDispatcher(
+            workers=0, batch_size=1, max_queue=1, idle_timeout=5
+        )
+        self.assertTrue(dispatcher.send("a@example.com", self.params))
+        self.assertFalse(dispatcher.send("b@example.com", self.params))
+        self.assertEqual(dispatcher.stats()["rejected"], 1)
+
+
+JOB_CALLS = []
+JOB_LOCK = Lock()
+JOB_RUNNING = {"now": 0, "most": 0}
+
+
+def record_job(*args, **kwargs):
+    JOB_CALLS.append((list(args), kwargs))
+
+
+def failing_job():
+    raise ValueError("boom")
+
+
+def slow_job():
+    with JOB_LOCK:
+        JOB_RUNNING["now"] += 1
+        JOB_RUNNING["most"] = max(JOB_RUNNING["most"], JOB_RUNNING["now"])
+    time.sleep(0.05)
+    with JOB_LOCK:
+        JOB_RUNNING["now"] -= 1
+
+
+class JobQueueTests(TransactionTestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+        JOB_RUNNING.update(now=0, most=0)
+
+    def run_jobs(self, *args):
+        out = StringIO()
+        call_command("run_jobs", "--burst", *args, stdout=out)
+        return out.getvalue()
+
+    def test_job_runs_once(self):
+        job = Job.objects.enqueue("users.tests.record_job", [1], {"a": "b"})
+        self.assertIn("1 done, 0 retried, 0 failed", self.run_jobs())
+        self.assertEqual(JOB_CALLS, [([1], {"a": "b"})])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ("done", 1, None))
+        self.assertIn("0 done", self.run_jobs())
+
+    def test_unknown_task(self):
+        with self.assertRaises(ImportError):
+            Job.objects.enqueue("users.tests.missing_job")
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = Job.objects.enqueue("users.tests.failing_job", max_attempts=2)
+        self.assertIn("0 done, 1 retried, 0 failed", self.run_jobs())
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.attempts, job.last_error), ("queued", 1, "boom")
+        )
+        self.assertGreater(job.run_at, datetime.now() + timedelta(seconds=5))
+
+        # not due yet
+        self.assertIn("0 retried, 0 failed", self.run_jobs())
+        Job.objects.update(run_at=datetime.now())
+        self.assertIn("0 retried, 1 failed", self.run_jobs())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+
+    def test_claimed_jobs_are_not_handed_out_again(self):
+        first = Job.objects.enqueue("users.tests.record_job")
+        second = Job.objects.enqueue("users.tests.record_job")
+        self.assertEqual(Job.objects.claim("default", 1, "a"), [first])
+        self.assertEqual(Job.objects.claim("default", 5, "b"), [second])
+        self.assertEqual(Job.objects.claim("default", 5, "c"), [])
+
+    def test_queue_concurrency_limit(self):
+        for _ in range(3):
+            Job.objects.enqueue("users.tests.slow_job", queue="mail")
+        with mock.patch.object(settings, "JOB_QUEUES", {"default": 4, "mail": 1}):
+            self.assertIn("3 done", self.run_jobs("--threads", "4"))
+        self.assertEqual(JOB_RUNNING["most"], 1)
+
+    def test_jobs_of_a_lost_worker_run_again(self):
+        job = Job.objects.enqueue("users.tests.record_job", max_attempts=2)
+        Job.objects.claim("default", 1, "lost")
+        Job.objects.update(locked_at=datetime.now() - timedelta(hours=1))
+        self.assertEqual(Job.objects.release_stale(60), 1)
+        self.assertIn("1 done", self.run_jobs())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("done", 2))
+
+    def test_reset_mail_as_job(self):
+        create_user()
+        with mock.patch.object(settings, "MAIL_JOB_QUEUE", True):
+            APIClient().post(
+                "/user/forgot-password", {"email": "user@example.com"}, format="json"
+            )
+        job = Job.objects.get()
+        self.assertEqual((job.queue, job.task), ("mail", "utils.mail_utils.send_email"))
+        self.assertIn("1 done", self.run_jobs("--queues", "mail"))
+        self.assertEqual(mail.outbox[0].to, ["user@example.com"])
+
+    def upload_image(self):
+        create_user()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=login(client)["access_token"])
+        image = BytesIO()
+        Image.new("RGB", (600, 300)).save(image, format="PNG")
+        upload = SimpleUploadedFile("photo.png", image.getvalue())
+        response = client.post("/user/image-upload", {"name": upload})
+        self.assertEqual(response.data["code"], 200)
+        return response.data
+
+    def test_thumbnail_job(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ), mock.patch.object(settings, "IMAGE_THUMBNAILS", True):
+            data = self.upload_image()
+            self.assertFalse(default_storage.exists(data["thumbnail_url"]))
+            self.assertIn("1 done", self.run_jobs("--queues", "images"))
+            with default_storage.open(data["thumbnail_url"]) as thumbnail:
+                self.assertEqual(Image.open(thumbnail).size, (256, 128))
+
+    def test_thumbnails_are_off_by_default(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ):
+            data = self.upload_image()
+        self.assertNotIn("thumbnail_url", data)
+        self.assertFalse(Job.objects.exists())
+
+    def test_unknown_queue(self):
+        with self.assertRaises(CommandError):
+            self.run_jobs("--queues", "mail,nope")
+
+
+class RetentionTests(TestCase):
+    def test_old_rows_are_deleted_in_chunks(self):
+        user = create_user()
+        old = datetime.now() - timedelta(days=400)
+        for _ in range(5):
+            UserNotification.objects.create(user_id=user, notification_text="old")
+        UserNotification.objects.update(created_at=old)
+        UserNotification.objects.create(user_id=user, notification_text="new")
+        Token.objects.create(expires_at=old, is_expired=True)
+        Token.objects.create(expires_at=datetime.now() + timedelta(hours=1))
+
+        out = StringIO()
+        call_command("enforce_retention", chunk_size=2, pause=0, stdout=out)
+
+        self.assertEqual(
+            list(UserNotification.objects.values_list("notification_text", flat=True)),
+            ["new"],
+        )
+        self.assertEqual(Token.objects.count(), 1)
+        self.assertIn("users.UserNotification chunk 3: 1 rows", out.getvalue())
+        self.assertIn("users.UserNotification: 5 rows removed", out.getvalue())
+
+    def test_deleted_searches_leave_the_counters(self):
+        user = create_user()
+        for query in ("aspirin", "ibuprofen"):
+            result = CrawlerStub.payload({"query": query})["result"]
+            record_searches(user, [(query, "platform", result)])
+        UserSearch.objects.filter(search_value="aspirin").update(
+            updated_at=datetime.now() - timedelta(days=400)
+        )
+        call_command("enforce_retention", pause=0, stdout=StringIO())
+        counter = UserSearchCounter.objects.get(user_id=user)
+        self.assertEqual(
+            (counter.search_count, counter.patent_count, counter.innovator_count),
+            (1, 3, 2),
+        )
+
+    def test_unused_results_go_with_their_searches(self):
+        old = datetime.now() - timedelta(days=400)
+        kept = SearchResult.objects.create(search_result_id="kept", content_hash="")
+        SearchResult.objects.create(search_result_id="unused", content_hash="")
+        UserSearch.objects.create(
+            user_id=create_user(), search_result_id="kept", result=kept
+        )
+        SearchResult.objects.update(updated_at=old)
+        call_command("enforce_retention", pause=0, stdout=StringIO())
+        self.assertEqual(
+            list(SearchResult.objects.values_list("search_result_id", flat=True)),
+            ["kept"],
+        )
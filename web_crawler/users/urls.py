@@ -26,12 +26,15 @@ from .views import (
     UploadImageViewSet,
     ChangePasswordViewSet,
     UserSearchViewSet,
+    CrawlerStatusViewSet,
     DashboardCountViewSet,
+    DashboardTimeSeriesViewSet,
     UserBookmarkViewSet,
     UserNotesViewSet,
     MonitoryViewSet,
     UserNotificationsViewSet,
     PlatformSearchViewSet,
+    PlatformSearchBatchViewSet,
     RefreshTokenViewSet)
 
 router = DefaultRouter(trailing_slash=False)
@@ -47,7 +50,18 @@ router.register(r"image-upload", UploadImageViewSet, basename="image-upload")
 router.register(r"change-password", ChangePasswordViewSet, basename="change-password")
 router.register(r"user-search", UserSearchViewSet, basename="user-search")
 router.register(r"platform-search", PlatformSearchViewSet, basename="platform-search")
+router.register(
+    r"platform-search-batch",
+    PlatformSearchBatchViewSet,
+    basename="platform-search-batch",
+)
+router.register(r"crawler-status", CrawlerStatusViewSet, basename="crawler-status")
 router.register(r"dashboard-count", DashboardCountViewSet, basename="dashboard-count")
+router.register(
+    r"dashboard-timeseries",
+    DashboardTimeSeriesViewSet,
+    basename="dashboard-timeseries",
+)
 router.register(r"user-bookmark", UserBookmarkViewSet, basename="user-bookmark")
 router.register(r"user-note", UserNotesViewSet, basename="user-note")
 router.register(r"monitory", MonitoryViewSet, basename="monitory")
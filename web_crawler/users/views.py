@@ -1,16 +1,14 @@
 import os
 import uuid
-from datetime import datetime, timedelta
-from threading import Thread
+from datetime import date, datetime, timedelta
 
-import requests
 from basicauth import decode
 from basicauth import encode
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.db.models import Sum, Count
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.response import Response
@@ -19,13 +17,40 @@ from authentication.authentication import JwtTokensAuthentication
 import logging
 
 from jwt_utils.jwt_validator import refresh_token_validator
-from users.models import Token, UserSearch, UserBookmark, UserNote, UserNotification
-from jwt_utils.jwt_generator import jwt_generator
+from users.models import (
+    Job,
+    Token,
+    UserSearch,
+    UserSearchCounter,
+    UserSearchDaily,
+    UserBookmark,
+    UserNote,
+    UserNotification,
+)
+from jwt_utils.token_digest import token_digest
+from jwt_utils.token_session import revoke_sessions, rotate_session
 from web_crawler import settings
-from utils.datetime_utils import calculate_time_difference, convert_to_str_time, convert_str_date
-from utils.mail_utils import send_email
+from utils.circuit_breaker import crawler_breaker
+from utils.crawler_cache import crawler_cache
+from utils.datetime_utils import (
+    DATE_FORMAT,
+    calculate_time_difference,
+    convert_to_str_time,
+    convert_str_date,
+)
+from utils.image_utils import thumbnail_path
+from utils.mail_utils import queue_email
 from utils.message_utils import get_message
-from utils.pagination import CustomPageNumberPagination
+from utils.pagination import CreatedAtCursorPagination, CustomPageNumberPagination
+from utils.search_utils import (
+    build_search_body,
+    fetch_search_result,
+    record_searches,
+    search_executor,
+    stream_search_result,
+)
+from utils.search_prefetch import next_page_body, search_prefetcher
+from utils.serializer_utils import ValuesListMixin
 from utils.validation_utils import (
     validate_email,
     validate_password,
@@ -154,28 +179,7 @@ class LoginViewSet(viewsets.ModelViewSet):
                     {"code": 503, "message": get_message(503)},
                     status=status.HTTP_204_NO_CONTENT,
                 )
-            access_token = jwt_generator(
-                user_obj.id,
-                settings.JWT_SECRET,
-                settings.TOKEN_EXPIRY,
-                "access",
-                user_obj.is_superuser,
-            )
-            refresh_token = jwt_generator(
-                user_obj.id,
-                settings.JWT_SECRET,
-                settings.REFRESH_TOKEN_EXPIRY,
-                "refresh",
-                user_obj.is_superuser,
-            )
-            Token.objects.filter(user_id=user_obj).update(is_expired=1)
-
-            Token.objects.update_or_create(
-                user_id=user_obj,
-                access_token=access_token,
-                refresh_token=refresh_token,
-                defaults={"updated_at": datetime.now()},
-            )
+            access_token, refresh_token = rotate_session(user_obj)
             return Response(
                 
                 {
@@ -196,7 +200,7 @@ class LoginViewSet(viewsets.ModelViewSet):
             )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ValuesListMixin, viewsets.ModelViewSet):
     authentication_classes = [JwtTokensAuthentication]
     pagination_class = CustomPageNumberPagination
     serializer_class = UserSerializer
@@ -232,9 +236,10 @@ class LogoutViewSet(viewsets.ModelViewSet):
         user_id = request.user.get("user_id")
         token_id = request.headers.get("Authorization", "")
         try:
-            token_obj = Token.objects.get(access_token=token_id, user_id=user_id)
-            token_obj.is_expired = 1
-            token_obj.save()
+            token_obj = Token.objects.get(
+                access_token_digest=token_digest(token_id), user_id=user_id
+            )
+            revoke_sessions(Token.objects.filter(pk=token_obj.pk))
             return Response({"code": 200, "message": get_message(200)})
         except Exception as ex:
             logger.error(ex)
@@ -273,8 +278,9 @@ class ForgotPasswordViewSet(viewsets.ModelViewSet):
                 "reset_url": reset_url,
                 "subject": "Reset Password Link",
             }
-            mail_thread = Thread(target=send_email, args=(email_id, messages))
-            mail_thread.start()
+            if not queue_email(email_id, messages):
+                logger.error("mail queue full, reset mail to %s dropped", email_id)
+                return Response({"code": 114, "message": get_message(114)})
             return Response(
                 {
                     "code": 200,
@@ -401,28 +407,13 @@ class RefreshTokenViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
-            access_token = jwt_generator(
-                user_obj.id,
-                settings.JWT_SECRET,
-                settings.TOKEN_EXPIRY,
-                "access",
-                user_obj.is_superuser,
-            )
-            refresh_token = jwt_generator(
-                user_obj.id,
-                settings.JWT_SECRET,
-                settings.REFRESH_TOKEN_EXPIRY,
-                "refresh",
-                user_obj.is_superuser,
-            )
-            Token.objects.filter(user_id=user_obj).update(is_expired=1)
-
-            Token.objects.update_or_create(
-                user_id=user_obj,
-                access_token=access_token,
-                refresh_token=refresh_token,
-                defaults={"updated_at": datetime.now()},
-            )
+            tokens = rotate_session(user_obj, refresh_token)
+            if tokens is None:
+                return Response(
+                    {"code": 401, "message": get_message(401)},
+                    status=status.HTTP_401_UNAUTHORIZED,
+                )
+            access_token, refresh_token = tokens
             return Response(
 
                 {
@@ -459,13 +450,20 @@ class UploadImageViewSet(viewsets.ModelViewSet):
         name = directory_name + image_name + "." + image_ext
         path = default_storage.save(name, ContentFile(image.read()))
         os.path.join(settings.MEDIA_ROOT, path)
-        return Response({"code": 200, "message": get_message(200), "image_url": path})
+        data = {"code": 200, "message": get_message(200), "image_url": path}
+        if settings.IMAGE_THUMBNAILS:
+            # the file shows up there once run_jobs made the thumbnail
+            Job.objects.enqueue(
+                "utils.image_utils.make_thumbnail", args=(path,), queue="images"
+            )
+            data["thumbnail_url"] = thumbnail_path(path)
+        return Response(data)
 
 
-class UserNotesViewSet(viewsets.ModelViewSet):
+class UserNotesViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = ()
     serializer_class = UserNotesSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     authentication_classes = [
         JwtTokensAuthentication,
     ]
@@ -508,10 +506,10 @@ class UserNotesViewSet(viewsets.ModelViewSet):
             return Response({"code": 114, "message": get_message(114)})
 
 
-class UserNotificationsViewSet(viewsets.ModelViewSet):
+class UserNotificationsViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = ()
     serializer_class = UserNotificationsSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     authentication_classes = [
         JwtTokensAuthentication,
     ]
@@ -544,10 +542,10 @@ class UserNotificationsViewSet(viewsets.ModelViewSet):
             return Response({"code": 114, "message": get_message(114)})
 
 
-class UserBookmarkViewSet(viewsets.ModelViewSet):
+class UserBookmarkViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = ()
     serializer_class = UserBookmarkSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     authentication_classes = [
         JwtTokensAuthentication,
     ]
@@ -587,7 +585,7 @@ class UserBookmarkViewSet(viewsets.ModelViewSet):
             return Response({"code": 114, "message": get_message(114)})
 
 
-class UserSearchViewSet(viewsets.ReadOnlyModelViewSet):
+class UserSearchViewSet(ValuesListMixin, viewsets.ReadOnlyModelViewSet):
     """list user searches ie, recent search
 
     create:
@@ -596,7 +594,7 @@ class UserSearchViewSet(viewsets.ReadOnlyModelViewSet):
 
     permission_classes = ()
     serializer_class = UserSearchSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     authentication_classes = [
         JwtTokensAuthentication,
     ]
@@ -663,13 +661,9 @@ class PlatformSearchViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
 
         search_value = request.data.get("search_value", None)
-        record_id = request.data.get("record_id", "")
-        record_type = request.data.get("record_type", "")
         search_type = request.data.get("search_type", "platform")
-        skip = request.data.get("index", 0)
-        top = request.user.get("limit", 10)
+        top = request.data.get("limit", 10)
         user_id = request.user.get("user_id")
-        count = 0
 
         if not search_value:
             return Response(
@@ -687,74 +681,166 @@ class PlatformSearchViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            body = {
-                "query": search_value,
-                "record_id": record_id,
-                "record_type": record_type,
-                "skip": skip,
-                "top": top,
-            }
-
-            base_url = settings.WEB_CRAWLER_BASE_URL
+            body = build_search_body(request.data, top)
+            if request.query_params.get("stream") in ("1", "true"):
+                return self.stream(user_obj, search_value, search_type, body)
             try:
-                api_result = requests.post(base_url + "fetch/records", json=body)
-                api_response = api_result.json()
+                api_response, stale = fetch_search_result(body)
                 logger.info(api_response)
-                api_response = api_response.get("result", {})
-                search_result_id = api_response.get("search_id", "")
-                patent_count = api_response.get("patents", {}).get("total_count", 0)
-                patent_id = api_response.get("patents", {}).get("id", "")
-                patent_name = api_response.get("patents", {}).get("name", "")
-                innovator_count = api_response.get("innovators", {}).get(
-                    "total_count", 0
-                )
-                innovator_id = api_response.get("innovators", {}).get("id", "")
-                innovator_name = api_response.get("innovators", {}).get("name", "")
-                print(search_result_id)
-
             except Exception as e:
                 logger.error(e)
                 print(e)
                 return Response({"code": 114, "message": get_message(114)})
-            try:
-                """if its platform - search result id needs to be checked. if it is url based,
-                search value will be checked"""
 
-                search_obj = UserSearch.objects.get(
-                    user_id=user_id, search_result_id=search_result_id
-                )
-                count = search_obj.search_count
-                search_obj.search_count = count + 1
-                search_obj.updated_at = datetime.now()
-                search_obj.save()
-            except ObjectDoesNotExist as e:
+            record_searches(user_obj, [(search_value, search_type, api_response)])
+            if settings.CRAWLER_PREFETCH and not stale:
+                next_body = next_page_body(body, api_response)
+                if next_body is not None:
+                    search_prefetcher.prefetch(user_id, next_body)
+            return Response(
+                {
+                    "code": 200,
+                    "message": get_message(200),
+                    "results": api_response,
+                    "stale": stale,
+                }
+            )
+
+        except Exception as e:
+            logger.error(e)
+            print(e)
+            return Response({"code": 114, "message": get_message(114)})
+
+
+    def stream(self, user_obj, search_value, search_type, body):
+        """Pass the crawler body through unchanged, record the search once read."""
+
+        def record(result):
+            logger.info(result)
+            try:
+                record_searches(user_obj, [(search_value, search_type, result)])
+            except Exception as e:
                 logger.error(e)
-                UserSearch.objects.create(
-                    user_id=user_obj,
-                    search_value=search_value,
-                    search_type=search_type,
-                    search_result_id=search_result_id,
-                    search_count=count + 1,
-                    patent_count=patent_count,
-                    patent_id=patent_id,
-                    patent_name=patent_name,
-                    innovator_count=innovator_count,
-                    innovator_id=innovator_id,
-                    innovator_name=innovator_name,
-                )
 
+        try:
+            chunks, content_type = stream_search_result(body, record)
+        except Exception as e:
+            logger.error(e)
+            return Response({"code": 114, "message": get_message(114)})
+        return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+class PlatformSearchBatchViewSet(viewsets.ModelViewSet):
+    """
+    several platform searches in one request, sent to the crawler concurrently
+    """
+
+    permission_classes = ()
+    serializer_class = UserSearchSerializer
+    authentication_classes = [
+        JwtTokensAuthentication,
+    ]
+
+    def create(self, request, *args, **kwargs):
+        queries = request.data.get("queries")
+        top = request.data.get("limit", 10)
+        user_id = request.user.get("user_id")
+
+        if not queries or not isinstance(queries, list):
+            return Response(
+                {"code": 306, "message": get_message(306)},
+                status=status.HTTP_412_PRECONDITION_FAILED,
+            )
+        if len(queries) > settings.CRAWLER_BATCH_MAX_QUERIES:
+            return Response(
+                {"code": 400, "message": get_message(400)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            user_obj = get_user_model().objects.get(id=user_id, is_verified=True)
+        except ObjectDoesNotExist as ex:
+            logger.error(ex)
             return Response(
-                {"code": 200, "message": get_message(200), "results": api_response}
+                {"code": 204, "message": get_message(204)},
+                status=status.HTTP_204_NO_CONTENT,
+            )
+
+        futures = []
+        for query in queries:
+            if isinstance(query, dict) and query.get("search_value"):
+                body = build_search_body(query, top)
+                futures.append(search_executor.submit(fetch_search_result, body))
+            else:
+                futures.append(None)
+
+        results = []
+        searches = []
+        for query, future in zip(queries, futures):
+            if future is None:
+                results.append({"code": 306, "message": get_message(306)})
+                continue
+            search_value = query["search_value"]
+            try:
+                api_response, stale = future.result()
+            except Exception as e:
+                logger.error(e)
+                results.append(
+                    {
+                        "search_value": search_value,
+                        "code": 114,
+                        "message": get_message(114),
+                    }
+                )
+                continue
+            searches.append(
+                (search_value, query.get("search_type", "platform"), api_response)
+            )
+            results.append(
+                {
+                    "search_value": search_value,
+                    "code": 200,
+                    "message": get_message(200),
+                    "results": api_response,
+                    "stale": stale,
+                }
             )
 
+        try:
+            if searches:
+                record_searches(user_obj, searches)
         except Exception as e:
             logger.error(e)
-            print(e)
             return Response({"code": 114, "message": get_message(114)})
 
+        return Response({"code": 200, "message": get_message(200), "results": results})
+
+
+class CrawlerStatusViewSet(viewsets.ReadOnlyModelViewSet):
+    """list : crawler breaker, cache and prefetch state of this worker, admins only"""
+
+    permission_classes = ()
+    serializer_class = DashboardSerializer
+    authentication_classes = [
+        JwtTokensAuthentication,
+    ]
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.get("is_admin", False):
+            return Response(
+                {"code": 403, "message": get_message(403)},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        result = {
+            "breaker": crawler_breaker.stats(),
+            "cache": crawler_cache.stats(),
+            "prefetch": search_prefetcher.stats(),
+        }
+        return Response({"code": 200, "message": get_message(200), "results": result})
+
 
 class DashboardCountViewSet(viewsets.ReadOnlyModelViewSet):
-    """list : the count showing in dashboard"""
+    """list : the count showing in dashboard, key=all returns every count"""
 
     permission_classes = ()
     serializer_class = DashboardSerializer
@@ -769,46 +855,71 @@ class DashboardCountViewSet(viewsets.ReadOnlyModelViewSet):
         user_id = request.user.get("user_id")
         result = {}
 
-        if key == "api":
-            api_count = 0
-            queryset = (
-                UserSearch.objects.filter(user_id=user_id)
-                .values("user_id")
-                .annotate(count=Count("search_value"))
-            )
-            total_api_count_list = list(queryset.values_list("count", flat=True))
-            if total_api_count_list:
-                api_count = total_api_count_list[0]
-            result[key] = api_count
-
-        if key == "patent":
-            patent_count = 0
-            queryset = (
-                UserSearch.objects.filter(user_id=user_id)
-                .values("user_id")
-                .annotate(count=Sum("patent_count"))
-            )
-            patent_api_count_list = list(queryset.values_list("count", flat=True))
-            if patent_api_count_list:
-                patent_count = patent_api_count_list[0]
-            result[key] = patent_count
-
-        if key == "innovator":
-            patent_count = 0
-            queryset = (
-                UserSearch.objects.filter(user_id=user_id)
-                .values("user_id")
-                .annotate(count=Sum("innovator_count"))
+        counter = (
+            UserSearchCounter.objects.filter(user_id=user_id)
+            .values("search_count", "patent_count", "innovator_count")
+            .first()
+            or {}
+        )
+        counts = {
+            "api": counter.get("search_count", 0),
+            "patent": counter.get("patent_count", 0),
+            "innovator": counter.get("innovator_count", 0),
+        }
+        if key == "all":
+            result = counts
+        elif key in counts:
+            result[key] = counts[key]
+
+        return Response({"code": 200, "message": get_message(200), "results": result})
+
+
+class DashboardTimeSeriesViewSet(viewsets.ReadOnlyModelViewSet):
+    """list : searches, patents and innovators per day between from and to"""
+
+    permission_classes = ()
+    serializer_class = DashboardSerializer
+    authentication_classes = [
+        JwtTokensAuthentication,
+    ]
+
+    def list(self, request, *args, **kwargs):
+        user_id = request.user.get("user_id")
+        end_date = request.query_params.get("to")
+        start_date = request.query_params.get("from")
+        try:
+            end_date = convert_str_date(end_date).date() if end_date else date.today()
+            if start_date:
+                start_date = convert_str_date(start_date).date()
+            else:
+                start_date = end_date - timedelta(days=29)
+        except ValueError:
+            return Response({"code": 400, "message": get_message(400)})
+        days = (end_date - start_date).days + 1
+        if not 0 < days <= settings.DASHBOARD_TIMESERIES_MAX_DAYS:
+            return Response({"code": 400, "message": get_message(400)})
+
+        rollups = UserSearchDaily.objects.filter(
+            user_id=user_id, day__gte=start_date, day__lte=end_date
+        ).values_list("day", "search_count", "patent_count", "innovator_count")
+        counts = {row[0]: row[1:] for row in rollups}
+        result = []
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            api, patent, innovator = counts.get(day, (0, 0, 0))
+            result.append(
+                {
+                    "day": day.strftime(DATE_FORMAT),
+                    "api": api,
+                    "patent": patent,
+                    "innovator": innovator,
+                }
             )
-            patent_api_count_list = list(queryset.values_list("count", flat=True))
-            if patent_api_count_list:
-                patent_count = patent_api_count_list[0]
-            result[key] = patent_count
 
         return Response({"code": 200, "message": get_message(200), "results": result})
 
 
-class MonitoryViewSet(viewsets.ModelViewSet):
+class MonitoryViewSet(ValuesListMixin, viewsets.ModelViewSet):
     """list  monitoring list
 
     create:
@@ -817,7 +928,7 @@ class MonitoryViewSet(viewsets.ModelViewSet):
 
     permission_classes = ()
     serializer_class = UserSearchSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CreatedAtCursorPagination
     authentication_classes = [
         JwtTokensAuthentication,
     ]
@@ -0,0 +1,108 @@
+"""
+circuit breaker for calls to the crawler backend
+"""
+import time
+from threading import Lock
+
+from web_crawler import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fail fast once a backend keeps failing.
+
+    After ``failure_threshold`` failures in a row the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. Then a single trial call is
+    let through, its outcome closes the breaker again or reopens it.
+    ``is_failure`` decides which exceptions count against the backend.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, is_failure=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure or (lambda error: True)
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.rejected = 0
+            self.opened_at = None
+
+    def call(self, func, *args, **kwargs):
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            if self.is_failure(error):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if (
+                self.state == OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = HALF_OPEN
+                return
+            # open, or half open with the trial call still running
+            self.rejected += 1
+        raise CircuitOpenError("circuit open, crawler calls are rejected")
+
+    def _on_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def _on_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                retry_in = max(0.0, round(self.reset_timeout - elapsed, 3))
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_in": retry_in,
+            }
+
+
+def is_crawler_failure(error):
+    """Errors and timeouts count, answers to bad requests (4xx) don't."""
+    response = getattr(error, "response", None)
+    return response is None or response.status_code >= 500
+
+
+crawler_breaker = CircuitBreaker(
+    settings.CRAWLER_BREAKER_FAILURES,
+    settings.CRAWLER_BREAKER_RESET,
+    is_failure=is_crawler_failure,
+)
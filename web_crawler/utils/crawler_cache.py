@@ -0,0 +1,134 @@
+"""
+cache of crawler results with request coalescing
+"""
+import json
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+
+from web_crawler import settings
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class CrawlerCache:
+    """Per-process LRU cache of crawler responses with a TTL.
+
+    Concurrent misses for the same key share one upstream call: the first
+    caller fetches, the others wait for its result (or its error). Expired
+    entries stay until evicted, :meth:`get_stale` serves them for up to
+    ``stale_ttl`` seconds when the crawler can't be reached.
+    """
+
+    def __init__(self, max_size, ttl, stale_ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict()
+        self._calls = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(body):
+        return json.dumps(body, sort_keys=True, default=str)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at >= self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        """The value for ``key`` even if expired, within ``stale_ttl``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at >= max(self.ttl, self.stale_ttl):
+                del self._entries[key]
+                return None
+            self.stale_hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for ``key`` or the result of ``fetch()``."""
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fetch()
+            self.set(key, call.value)
+            return call.value
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = self.stale_hits = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+            }
+
+
+crawler_cache = CrawlerCache(
+    settings.CRAWLER_CACHE_SIZE,
+    settings.CRAWLER_CACHE_TTL,
+    stale_ttl=settings.CRAWLER_STALE_TTL,
+)
@@ -0,0 +1,129 @@
+"""
+http client for the web crawler backend
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from web_crawler import settings
+
+
+class CrawlerClient:
+    """Keep-alive connection pool to the crawler, one session per process.
+
+    Connection failures and 502/503/504 answers are retried with exponential
+    backoff. ``fetch/records`` only reads, so retrying the POST is safe.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(
+        self,
+        base_url,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=30,
+        retries=2,
+        backoff_factor=0.3,
+    ):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        self._pid = None
+        self._lock = Lock()
+
+    @property
+    def session(self):
+        # sessions must not be shared with a forked child process
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._create_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _create_session(self):
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def post(self, path, body, timeout=None, **kwargs):
+        return self.session.post(
+            self.base_url + path, json=body, timeout=timeout or self.timeout, **kwargs
+        )
+
+    def fetch_records(self, body):
+        response = self.post("fetch/records", body)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_records(self, body, timeout=None):
+        """fetch/records with the body left unread, the caller must close it."""
+        response = self.post("fetch/records", body, timeout=timeout, stream=True)
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+crawler_client = CrawlerClient(
+    settings.WEB_CRAWLER_BASE_URL,
+    pool_size=settings.CRAWLER_POOL_SIZE,
+    connect_timeout=settings.CRAWLER_CONNECT_TIMEOUT,
+    read_timeout=settings.CRAWLER_READ_TIMEOUT,
+    retries=settings.CRAWLER_RETRIES,
+    backoff_factor=settings.CRAWLER_RETRY_BACKOFF,
+)
+# runs the crawler calls themselves, so callers can stop waiting at the deadline
+crawler_call_executor = ThreadPoolExecutor(
+    max_workers=settings.CRAWLER_POOL_SIZE, thread_name_prefix="crawler-call"
+)
+
+
+def call_by_deadline(func, *args, on_late=None):
+    """``func(*args)`` that gives up after CRAWLER_DEADLINE seconds.
+
+    The call itself keeps running in the background until the client's own
+    timeouts end it, ``on_late`` gets its result if it still arrives.
+    """
+    future = crawler_call_executor.submit(func, *args)
+    try:
+        return future.result(timeout=settings.CRAWLER_DEADLINE)
+    except FutureTimeoutError:
+        if not future.cancel() and on_late is not None:
+            future.add_done_callback(
+                lambda done: done.exception() is None and on_late(done.result())
+            )
+        raise FutureTimeoutError(
+            "crawler gave no answer in %s seconds" % settings.CRAWLER_DEADLINE
+        )
+
+
+def fetch_records_by_deadline(body):
+    """crawler_client.fetch_records that gives up after CRAWLER_DEADLINE seconds."""
+    return call_by_deadline(crawler_client.fetch_records, body)
@@ -0,0 +1,88 @@
+"""
+database helpers the ORM of this Django version does not offer
+"""
+from datetime import datetime
+
+from django.db import connections, models, router
+
+
+def upsert(model, rows, conflict_fields, increment_fields=(), update_fields=()):
+    """Insert ``rows`` (dicts of field name to value) in one statement.
+
+    When a row collides with an existing one on the unique ``conflict_fields``,
+    ``increment_fields`` are added to the existing values and
+    ``update_fields`` overwrite them. With neither, the insert is skipped and
+    the existing row is left as it is. Fields missing from a row get their
+    model default, auto_now(_add) fields get the current time.
+    Returns the driver's row count.
+    """
+    if not rows:
+        return 0
+    using = router.db_for_write(model)
+    connection = connections[using]
+    now = datetime.now()
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    timestamps = {
+        field.name
+        for field in fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    }
+
+    params = []
+    for row in rows:
+        for field in fields:
+            if field.name in row:
+                value = row[field.name]
+            elif field.name in timestamps:
+                value = now
+            else:
+                value = field.get_default()
+            if isinstance(value, models.Model):
+                value = value.pk
+            params.append(field.get_db_prep_save(value, connection))
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(field.column) for field in fields]
+    placeholders = "(%s)" % ", ".join(["%s"] * len(fields))
+
+    def column(name):
+        return quote(model._meta.get_field(name).column)
+
+    if connection.vendor == "mysql":
+        new_value, old_value = "VALUES(%s)", "%s"
+    else:
+        new_value, old_value = "excluded.%s", table + ".%s"
+    assignments = []
+    for name in increment_fields:
+        name = column(name)
+        assignments.append("%s = %s + %s" % (name, old_value % name, new_value % name))
+    for name in update_fields:
+        name = column(name)
+        assignments.append("%s = %s" % (name, new_value % name))
+
+    if connection.vendor == "mysql":
+        if not assignments:
+            # a no-op assignment, INSERT IGNORE would hide other errors too
+            name = column(conflict_fields[0])
+            assignments.append("%s = %s" % (name, name))
+        conflict = "ON DUPLICATE KEY UPDATE %s" % ", ".join(assignments)
+    elif not assignments:
+        conflict = "ON CONFLICT (%s) DO NOTHING" % ", ".join(
+            column(name) for name in conflict_fields
+        )
+    else:
+        conflict = "ON CONFLICT (%s) DO UPDATE SET %s" % (
+            ", ".join(column(name) for name in conflict_fields),
+            ", ".join(assignments),
+        )
+
+    sql = "INSERT INTO %s (%s) VALUES %s %s" % (
+        table,
+        ", ".join(columns),
+        ", ".join([placeholders] * len(rows)),
+        conflict,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
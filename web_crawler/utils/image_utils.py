@@ -0,0 +1,31 @@
+"""
+image processing, run as background jobs
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from web_crawler import settings
+
+
+def thumbnail_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, "thumbnails", name)
+
+
+def make_thumbnail(path):
+    """Store the image at ``path`` scaled down to IMAGE_THUMBNAIL_SIZE."""
+    with default_storage.open(path) as image_file:
+        image = Image.open(image_file)
+        image_format = image.format
+        image.thumbnail(settings.IMAGE_THUMBNAIL_SIZE)
+        thumbnail = BytesIO()
+        image.save(thumbnail, format=image_format)
+    target = thumbnail_path(path)
+    # a retried job replaces what an earlier attempt left behind
+    if default_storage.exists(target):
+        default_storage.delete(target)
+    return default_storage.save(target, ContentFile(thumbnail.getvalue()))
@@ -0,0 +1,109 @@
+"""
+worker running the jobs stored in the Job table
+"""
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+from django.db import close_old_connections, connection
+
+from users.models import Job
+
+logger = logging.getLogger(__name__)
+
+# seconds between two looks for jobs whose worker died
+RELEASE_INTERVAL = 60
+
+
+class JobWorker:
+    """Runs due jobs on ``threads`` threads.
+
+    ``queues`` maps the queues to take jobs from to the most jobs of each
+    running at once in this worker. Jobs that raise are retried by
+    ``Job.retry_or_fail``.
+    """
+
+    def __init__(self, queues, threads, poll_interval, lock_timeout):
+        self.queues = queues
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.name = "%s:%d" % (socket.gethostname(), os.getpid())
+        self._lock = Lock()
+        self._running = defaultdict(int)
+        self._wakeup = Event()
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+    def running(self):
+        with self._lock:
+            return sum(self._running.values())
+
+    def run(self, stop=None, burst=False):
+        """Run jobs until ``stop`` is set, with ``burst`` until none are due."""
+        stop = stop or Event()
+        released_at = None
+        with ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix="job"
+        ) as executor:
+            while not stop.is_set():
+                close_old_connections()
+                now = time.monotonic()
+                if released_at is None or now - released_at > RELEASE_INTERVAL:
+                    released = Job.objects.release_stale(self.lock_timeout)
+                    if released:
+                        logger.warning("released %d stale jobs", released)
+                    released_at = now
+                started = self._start_due(executor)
+                if burst and not started and not self.running():
+                    return
+                if not started:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+
+    def _start_due(self, executor):
+        started = 0
+        for queue, limit in self.queues.items():
+            with self._lock:
+                free = min(
+                    limit - self._running[queue],
+                    self.threads - sum(self._running.values()),
+                )
+            if free <= 0:
+                continue
+            for job in Job.objects.claim(queue, free, self.name):
+                with self._lock:
+                    self._running[queue] += 1
+                executor.submit(self._execute, job)
+                started += 1
+        return started
+
+    def _execute(self, job):
+        try:
+            try:
+                job.run()
+            except Exception as ex:
+                logger.error("job %d %s failed: %s", job.pk, job.task, ex)
+                retried = job.retry_or_fail(ex)
+                with self._lock:
+                    if retried:
+                        self.retried += 1
+                    else:
+                        self.failed += 1
+            else:
+                job.finish()
+                with self._lock:
+                    self.done += 1
+        except Exception as ex:
+            # the job stays running until release_stale hands it out again
+            logger.error("job %d could not be released: %s", job.pk, ex)
+        finally:
+            connection.close()
+            with self._lock:
+                self._running[job.queue] -= 1
+            self._wakeup.set()
@@ -1,23 +1,207 @@
-from django.core.mail import send_mail
+import logging
+import os
+import queue
+import smtplib
+from functools import lru_cache
+from threading import Lock, Thread
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template import loader
 
+from users.models import Job
 from web_crawler import settings
 
+logger = logging.getLogger(__name__)
+
+# compiled once per process, the loader would parse the file on every mail
+get_template = lru_cache(maxsize=None)(loader.get_template)
 
-def send_email(email, params):
-    email_template_name = params.pop("html")
 
+def email_message(email, params, connection=None):
+    """The html mail described by ``params`` (template in "html", "subject"
+    and the template context) for ``email``."""
+    params = dict(params)
+    email_template_name = params.pop("html")
     subject = params.pop("subject")
-    message = ""
-    template = loader.get_template(email_template_name)
-    html_message = template.render(params)
-    send_mail(
-        subject,
-        message,
-        settings.EMAIL_HOST_USER,
-        [email],
+    message = EmailMultiAlternatives(
+        subject, "", settings.EMAIL_HOST_USER, [email], connection=connection
+    )
+    html_message = get_template(email_template_name).render(params)
+    message.attach_alternative(html_message, "text/html")
+    return message
+
+
+def mail_connection():
+    return get_connection(
+        username=settings.EMAIL_HOST_USER,
+        password=settings.EMAIL_HOST_PASSWORD,
         fail_silently=False,
-        auth_user=settings.EMAIL_HOST_USER,
-        auth_password=settings.EMAIL_HOST_PASSWORD,
-        html_message=html_message,
     )
+
+
+def send_email(email, params):
+    email_message(email, params, connection=mail_connection()).send()
+
+
+class MailDispatcher:
+    """Sends queued mails from ``workers`` threads.
+
+    Every worker keeps its SMTP connection open between mails and sends
+    whatever is queued, up to ``batch_size`` mails, over it one by one. A
+    mail that fails is counted and skipped, when the server has dropped the
+    connection the rest of the batch is sent again over a new one. The
+    connection is closed after ``idle_timeout`` seconds without mail and
+    after it failed. At most ``max_queue`` mails wait, ``send``
+    refuses more. Queued mails are lost if the process dies.
+    """
+
+    def __init__(self, workers, batch_size, max_queue, idle_timeout):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = Lock()
+        self._pid = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queued = 0
+            self.rejected = 0
+            self.sent = 0
+            self.failed = 0
+            self.batches = 0
+            self.connections = 0
+
+    def send(self, email, params):
+        """Queue a mail for :func:`email_message`, False when the queue is full."""
+        self._start()
+        try:
+            self._queue.put_nowait((email, params))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def join(self):
+        """Wait until every queued mail was sent or failed."""
+        self._queue.join()
+
+    def _start(self):
+        # threads do not survive a fork, start the workers per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        for number in range(self.workers):
+            Thread(target=self._run, daemon=True, name="mail-%d" % number).start()
+
+    def _next_batch(self):
+        batch = [self._queue.get(timeout=self.idle_timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        connection = None
+        while True:
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                continue
+            messages = []
+            for email, params in batch:
+                try:
+                    messages.append(email_message(email, params))
+                except Exception as ex:
+                    logger.error("rendering mail to %s failed: %s", email, ex)
+            sent = 0
+            reconnected = False
+            while messages:
+                try:
+                    if connection is None:
+                        connection = mail_connection()
+                        with self._lock:
+                            self.connections += 1
+                    # opens the connection unless it already is
+                    connection.open()
+                    while messages:
+                        try:
+                            sent += connection.send_messages(messages[:1]) or 0
+                        except smtplib.SMTPServerDisconnected:
+                            raise
+                        except Exception as ex:
+                            logger.error(
+                                "sending mail to %s failed: %s", messages[0].to, ex
+                            )
+                        messages.pop(0)
+                except Exception as ex:
+                    # reconnect once when the server dropped the connection,
+                    # e.g. after idling, and resend the unsent rest of the batch
+                    connection = self._discard(connection)
+                    if reconnected or not isinstance(
+                        ex, smtplib.SMTPServerDisconnected
+                    ):
+                        logger.error("sending %d mails failed: %s", len(messages), ex)
+                        break
+                    reconnected = True
+            with self._lock:
+                self.batches += 1
+                self.sent += sent
+                self.failed += len(batch) - sent
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _discard(connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "waiting": self._queue.qsize(),
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "sent": self.sent,
+                "failed": self.failed,
+                "batches": self.batches,
+                "connections": self.connections,
+            }
+
+
+mail_dispatcher = MailDispatcher(
+    settings.MAIL_WORKERS,
+    settings.MAIL_BATCH_SIZE,
+    settings.MAIL_QUEUE_SIZE,
+    settings.MAIL_IDLE_TIMEOUT,
+)
+
+
+def queue_email(email, params):
+    """Send the mail in the background, False when it could not be queued.
+
+    With MAIL_JOB_QUEUE it is stored as a job on the "mail" queue and
+    survives restarts, otherwise it goes to the in-process mail_dispatcher.
+    """
+    if settings.MAIL_JOB_QUEUE:
+        Job.objects.enqueue(
+            "utils.mail_utils.send_email", args=(email, params), queue="mail"
+        )
+        return True
+    return mail_dispatcher.send(email, params)
@@ -0,0 +1,235 @@
+"""
+re-runs monitored searches and notifies users of changed results
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from users.models import SearchResult, UserNotification, UserSearch, summary_hash
+from utils.circuit_breaker import crawler_breaker
+from utils.crawler_client import crawler_client
+from utils.search_utils import build_search_body, new_ids, search_summary
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_TEXT = 'New results for "%s": %d patents (was %d), %d innovators (was %d)'
+NEW_IDS_TEXT = "; new %s: %s"
+# new ids listed in a notification, the rest are counted
+NEW_IDS_SHOWN = 10
+
+
+def monitored_values(chunk_size):
+    """Distinct monitored search values, ``chunk_size`` at a time.
+
+    Walks the (needs_monitoring, search_value) index by key, so no chunk
+    needs more than ``chunk_size`` values in memory.
+    """
+    queryset = (
+        UserSearch.objects.filter(needs_monitoring=True, search_value__isnull=False)
+        .order_by("search_value")
+        .values_list("search_value", flat=True)
+        .distinct()
+    )
+    last_value = None
+    while True:
+        chunk = queryset
+        if last_value is not None:
+            chunk = chunk.filter(search_value__gt=last_value)
+        values = list(chunk[:chunk_size])
+        if not values:
+            return
+        last_value = values[-1]
+        yield values
+        if len(values) < chunk_size:
+            return
+
+
+def fetch_summary(search_value):
+    """search_summary of the result the crawler has for ``search_value`` now."""
+    body = build_search_body({"search_value": search_value})
+    api_response = crawler_breaker.call(crawler_client.fetch_records, body)
+    return search_summary(api_response.get("result", {}))
+
+
+def detect_changes(summaries, now):
+    """Compare ``summaries`` with the stored SearchResult snapshots.
+
+    ``summaries`` maps search values to their search_summary. Results whose
+    hash matches the snapshot are left out, the others are saved and
+    returned as search value to (patents, innovators, new patent ids, new
+    innovator ids). New ids are only known once a snapshot exists.
+
+    Call it in the transaction that writes the notifications of the changes,
+    a saved snapshot hides its change from every later cycle.
+    """
+    snapshots = SearchResult.objects.in_bulk(
+        {summary["search_result_id"] for summary in summaries.values()} - {""},
+        field_name="search_result_id",
+    )
+    changes = {}
+    created = {}
+    updated = []
+    for search_value, summary in summaries.items():
+        search_result_id = summary["search_result_id"]
+        content_hash = summary_hash(summary)
+        snapshot = snapshots.get(search_result_id)
+        if snapshot is not None and snapshot.content_hash == content_hash:
+            continue
+        changes[search_value] = (
+            summary["patent_count"] or 0,
+            summary["innovator_count"] or 0,
+            new_ids(summary["patent_id"], snapshot.patent_id) if snapshot else [],
+            new_ids(summary["innovator_id"], snapshot.innovator_id)
+            if snapshot
+            else [],
+        )
+        if not search_result_id:
+            continue
+        if snapshot is None:
+            snapshot = created.setdefault(
+                search_result_id, SearchResult(search_result_id=search_result_id)
+            )
+        else:
+            updated.append(snapshot)
+        snapshot.content_hash = content_hash
+        snapshot.patent_count = summary["patent_count"] or 0
+        snapshot.patent_id = summary["patent_id"] or ""
+        snapshot.innovator_count = summary["innovator_count"] or 0
+        snapshot.innovator_id = summary["innovator_id"] or ""
+        snapshot.patent_name = summary["patent_name"] or ""
+        snapshot.innovator_name = summary["innovator_name"] or ""
+        snapshot.updated_at = now
+    SearchResult.objects.bulk_create(created.values(), batch_size=500)
+    SearchResult.objects.bulk_update(
+        updated,
+        [
+            "content_hash",
+            "patent_count",
+            "patent_id",
+            "innovator_count",
+            "innovator_id",
+            "patent_name",
+            "innovator_name",
+            "updated_at",
+        ],
+        batch_size=500,
+    )
+    return changes
+
+
+def notification_text(search_value, change, last_patents, last_innovators):
+    patents, innovators, new_patents, new_innovators = change
+    text = NOTIFICATION_TEXT % (
+        search_value,
+        patents,
+        last_patents,
+        innovators,
+        last_innovators,
+    )
+    for name, ids in (("patents", new_patents), ("innovators", new_innovators)):
+        if ids:
+            shown = ", ".join(ids[:NEW_IDS_SHOWN])
+            if len(ids) > NEW_IDS_SHOWN:
+                shown += " and %d more" % (len(ids) - NEW_IDS_SHOWN)
+            text += NEW_IDS_TEXT % (name, shown)
+    return text
+
+
+def notify_changes(changes, now):
+    """Notify the owners of monitored rows of the values in ``changes``.
+
+    ``changes`` comes from :func:`detect_changes`. A row is notified when
+    its counts differ from the new ones or the result has new ids. Returns
+    the number of notifications written.
+    """
+    rows = (
+        UserSearch.objects.filter(
+            needs_monitoring=True,
+            search_value__in=list(changes),
+            user_id__isnull=False,
+        )
+        .annotate(
+            last_patents=Coalesce("monitored_patent_count", "patent_count"),
+            last_innovators=Coalesce("monitored_innovator_count", "innovator_count"),
+        )
+        .values_list("user_id", "search_value", "last_patents", "last_innovators")
+    )
+    notifications = {}
+    changed = set()
+    for user_id, search_value, last_patents, last_innovators in rows.iterator():
+        change = changes[search_value]
+        patents, innovators, new_patents, new_innovators = change
+        last_patents, last_innovators = last_patents or 0, last_innovators or 0
+        if (
+            (last_patents, last_innovators) == (patents, innovators)
+            and not new_patents
+            and not new_innovators
+        ):
+            continue
+        changed.add(search_value)
+        notifications.setdefault(
+            (user_id, search_value),
+            UserNotification(
+                user_id_id=user_id,
+                notification_text=notification_text(
+                    search_value, change, last_patents, last_innovators
+                ),
+            ),
+        )
+    UserNotification.objects.bulk_create(notifications.values(), batch_size=500)
+    for search_value in changed:
+        patents, innovators = changes[search_value][:2]
+        UserSearch.objects.filter(
+            needs_monitoring=True, search_value=search_value
+        ).update(
+            monitored_patent_count=patents,
+            monitored_innovator_count=innovators,
+            monitored_at=now,
+        )
+    return len(notifications)
+
+
+def run_monitoring_cycle(workers, chunk_size):
+    """Re-run every distinct monitored search once.
+
+    At most ``workers`` crawler calls run at a time. Returns the number of
+    queries run, failed, unchanged since the last cycle and notifications
+    written.
+    """
+    stats = {"queries": 0, "failed": 0, "unchanged": 0, "notifications": 0}
+    now = datetime.now()
+
+    def fetch(search_value):
+        try:
+            return search_value, fetch_summary(search_value)
+        except Exception as ex:
+            logger.error("monitoring %r failed: %s", search_value, ex)
+            return search_value, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for values in monitored_values(chunk_size):
+            summaries = {}
+            for search_value, summary in executor.map(fetch, values):
+                stats["queries"] += 1
+                if summary is None:
+                    stats["failed"] += 1
+                else:
+                    summaries[search_value] = summary
+            if not summaries:
+                continue
+            try:
+                # the snapshots only commit together with their notifications,
+                # a failed chunk is detected as changed again next cycle
+                with transaction.atomic():
+                    changes = detect_changes(summaries, now)
+                    notifications = notify_changes(changes, now) if changes else 0
+            except Exception as ex:
+                logger.error("monitoring %d queries failed: %s", len(summaries), ex)
+                stats["failed"] += len(summaries)
+                continue
+            stats["unchanged"] += len(summaries) - len(changes)
+            stats["notifications"] += notifications
+    return stats
@@ -1,10 +1,112 @@
 # -*- coding: utf-8 -*-
 """DRF pagination settings."""
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 15
     page_size_query_param = "page_size"
     max_page_size = 200
+
+
+class CreatedAtCursorPagination(CustomPageNumberPagination):
+    """Page numbers by default, keyset pages on (created_at, id) with ``?cursor=``.
+
+    A request carrying the cursor parameter (empty for the first page) gets
+    the newest rows first with ``next``/``previous`` cursor links and no
+    count. Every page is one indexed range read, however deep it is.
+    """
+
+    cursor_query_param = "cursor"
+    position_fields = ("created_at", "id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        # the plain bound on created_at lets the index seek to the position
+        if reverse:
+            queryset = queryset.order_by("created_at", "id")
+            if position:
+                created_at, pk = position
+                queryset = queryset.filter(created_at__gte=created_at).exclude(
+                    created_at=created_at, id__lte=pk
+                )
+        else:
+            queryset = queryset.order_by("-created_at", "-id")
+            if position:
+                created_at, pk = position
+                queryset = queryset.filter(created_at__lte=created_at).exclude(
+                    created_at=created_at, id__gte=pk
+                )
+
+        rows = list(queryset[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = self.row_position(rows[-1]) if has_next and rows else None
+        self.previous_position = (
+            self.row_position(rows[0]) if has_previous and rows else None
+        )
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_cursor_link(self.next_position, False)),
+                    ("previous", self.get_cursor_link(self.previous_position, True)),
+                    ("results", data),
+                ]
+            )
+        )
+
+    @staticmethod
+    def row_position(row):
+        if isinstance(row, dict):
+            return row["created_at"], row["id"]
+        return row.created_at, row.id
+
+    def encode_cursor(self, position, reverse=False):
+        created_at, pk = position
+        cursor = json.dumps([created_at.isoformat(), pk, reverse])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            created_at, pk, reverse = json.loads(base64.urlsafe_b64decode(cursor))
+            return (datetime.fromisoformat(created_at), int(pk)), bool(reverse)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position, reverse)
+        )
@@ -0,0 +1,72 @@
+"""
+orjson and MessagePack renderers
+
+msgpack is optional, MessagePackRenderer is only usable when it is installed.
+"""
+import math
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# types orjson and msgpack don't know (Decimal, lazy strings, ...) are
+# encoded the way DRF's JSONRenderer does it
+encode_default = JSONEncoder().default
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def has_non_finite(data):
+    """Whether ``data`` holds a NaN or infinite float anywhere."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, (list, tuple)):
+        return False
+    return any(has_non_finite(item) for item in data)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Drop-in for JSONRenderer, same output through orjson.
+
+    What orjson can't render the same way goes through JSONRenderer: integers
+    wider than 64 bits, and NaN and infinity, which orjson writes as null
+    where JSONRenderer refuses them.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        options = ORJSON_OPTIONS
+        # orjson only indents by two spaces, used for any requested indent
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        try:
+            ret = orjson.dumps(data, default=encode_default, option=options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"null" in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped like JSONRenderer does, they end a line in javascript
+        if b"\xe2\x80" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
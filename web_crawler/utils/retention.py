@@ -0,0 +1,72 @@
+"""
+table retention policies
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.apps import apps
+
+from web_crawler import settings
+
+
+class RetentionPolicy:
+    """Rows of ``model`` whose ``date_field`` is older than ``days`` are deleted.
+
+    ``filters`` narrows the rows the policy applies to, e.g. only expired
+    tokens.
+    """
+
+    def __init__(self, model, days, date_field="created_at", filters=None):
+        self.model = model
+        self.days = days
+        self.date_field = date_field
+        self.filters = filters or {}
+
+    @property
+    def model_class(self):
+        return apps.get_model(self.model)
+
+    def queryset(self, now=None):
+        cutoff = (now or datetime.now()) - timedelta(days=self.days)
+        lookup = {"%s__lt" % self.date_field: cutoff}
+        return self.model_class.objects.filter(**self.filters, **lookup)
+
+    def enforce(self, chunk_size, pause=0.0, dry_run=False):
+        """Delete expired rows in primary key order, ``chunk_size`` at a time.
+
+        Yields ``(deleted, seconds)`` for every chunk. Each chunk is its own
+        short statement so no long lock is held on the table.
+        """
+        queryset = self.queryset().order_by("pk")
+        last_pk = None
+        while True:
+            chunk = queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                return
+            last_pk = pks[-1]
+            start = time.perf_counter()
+            if dry_run:
+                deleted = len(pks)
+            else:
+                deleted = self.delete(pks)
+            yield deleted, time.perf_counter() - start
+            if len(pks) < chunk_size:
+                return
+            if pause:
+                time.sleep(pause)
+
+    def delete(self, pks):
+        """Delete the rows of ``pks``, through the manager's ``delete_rows`` if it
+        has one to keep derived data in step."""
+        manager = self.model_class.objects
+        if hasattr(manager, "delete_rows"):
+            return manager.delete_rows(pks)
+        deleted, _ = manager.filter(pk__in=pks).delete()
+        return deleted
+
+
+def get_policies():
+    return [RetentionPolicy(**policy) for policy in settings.RETENTION_POLICIES]
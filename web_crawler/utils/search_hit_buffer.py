@@ -0,0 +1,125 @@
+"""
+write-behind buffer for UserSearch hit counters
+"""
+import atexit
+import logging
+import os
+import time
+from threading import Lock, Thread
+
+from django.db import connection
+
+from users.models import UserSearch
+from web_crawler import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHitBuffer:
+    """Collects UserSearch hits in memory and writes them as one batched upsert.
+
+    A flush happens once ``max_pending`` hits are buffered, every
+    ``flush_interval`` seconds from a background thread, and at interpreter
+    exit. A failed flush keeps its hits, ``add`` tries again no sooner than
+    ``retry_delay`` seconds later. At most ``max_retained`` hits are held,
+    while the database is down further hits are dropped and logged.
+
+    Hits are not durable until flushed: if the process dies without running
+    its exit handlers (crash, OOM kill, SIGKILL) at most ``max_pending - 1``
+    hits are lost while flushes succeed, and at most ``max_retained`` after
+    they failed.
+
+    Without ``flush_interval`` there is no background thread or exit hook,
+    the buffer is only flushed when full or by calling ``flush()``.
+    """
+
+    def __init__(
+        self, max_pending, flush_interval=None, max_retained=None, retry_delay=5
+    ):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_retained = max(max_retained or 10 * max_pending, max_pending)
+        self.retry_delay = retry_delay
+        self.pending = 0
+        self.dropped = 0
+        self._retry_at = 0
+        self._rows = {}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._pid = None
+
+    def add(self, rows):
+        """Buffer ``rows`` in the format taken by ``UserSearch.objects.record_hits``."""
+        self._start()
+        if (
+            self._merge(rows) >= self.max_pending
+            and time.monotonic() >= self._retry_at
+        ):
+            self.flush()
+
+    def _merge(self, rows):
+        dropped = 0
+        with self._lock:
+            for row in rows:
+                if self.pending + row["search_count"] > self.max_retained:
+                    dropped += row["search_count"]
+                    continue
+                user_id = getattr(row["user_id"], "pk", row["user_id"])
+                key = (user_id, row["search_result_id"])
+                buffered = self._rows.get(key)
+                if buffered is None:
+                    self._rows[key] = dict(row, user_id=user_id)
+                else:
+                    buffered["search_count"] += row["search_count"]
+                self.pending += row["search_count"]
+            self.dropped += dropped
+            pending = self.pending
+        if dropped:
+            logger.error("search hit buffer full, dropped %d hits", dropped)
+        return pending
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._rows.values())
+                pending = self.pending
+                self._rows = {}
+                self.pending = 0
+            if not rows:
+                return 0
+            try:
+                UserSearch.objects.record_hits(rows)
+            except Exception as e:
+                # keep the hits for the next attempt, up to max_retained
+                logger.error(e)
+                self._retry_at = time.monotonic() + self.retry_delay
+                self._merge(rows)
+                return 0
+            self._retry_at = 0
+            return pending
+
+    def _start(self):
+        # the flusher thread does not survive a fork, start one per process
+        if not self.flush_interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        Thread(target=self._run, daemon=True, name="search-hit-flusher").start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+search_hit_buffer = SearchHitBuffer(
+    settings.SEARCH_HIT_BUFFER_SIZE,
+    settings.SEARCH_HIT_FLUSH_INTERVAL,
+    settings.SEARCH_HIT_MAX_RETAINED,
+)
@@ -0,0 +1,148 @@
+"""
+speculative prefetch of the next page of a platform search
+"""
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from utils.circuit_breaker import CLOSED, crawler_breaker
+from utils.crawler_cache import crawler_cache
+from utils.crawler_client import fetch_records_by_deadline
+from web_crawler import settings
+
+
+class SearchPrefetcher:
+    """Fetch crawler pages into crawler_cache before they are asked for.
+
+    At most ``max_in_flight`` prefetches run per process and
+    ``max_per_user`` per user, others are skipped, as are all of them while
+    crawler_breaker is not closed. Prefetches are held to CRAWLER_DEADLINE
+    like the searches themselves. ``fetched`` counts the
+    pages a prefetch actually requested from the crawler, a hit is a search
+    served from one of them.
+    """
+
+    def __init__(self, max_in_flight, max_per_user):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self._executor = None
+        self._lock = Lock()
+        self._per_user = defaultdict(int)
+        # keys fetched by a prefetch and not asked for yet
+        self._prefetched = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._per_user.clear()
+            self._prefetched.clear()
+            self.in_flight = 0
+            self.scheduled = 0
+            self.skipped = 0
+            self.completed = 0
+            self.failed = 0
+            self.fetched = 0
+            self.hits = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=max(self.max_in_flight, 1),
+                        thread_name_prefix="crawler-prefetch",
+                    )
+        return self._executor
+
+    def prefetch(self, user_id, body):
+        """Start fetching ``body`` in the background, False when skipped."""
+        key = crawler_cache.make_key(body)
+        if crawler_cache.get(key) is not None:
+            return False
+        with self._lock:
+            # the trial call of a half open breaker is left to a search
+            if (
+                crawler_breaker.state != CLOSED
+                or self.in_flight >= self.max_in_flight
+                or self._per_user[user_id] >= self.max_per_user
+            ):
+                self.skipped += 1
+                return False
+            self.in_flight += 1
+            self._per_user[user_id] += 1
+            self.scheduled += 1
+        self.executor.submit(self._run, user_id, key, body)
+        return True
+
+    def _run(self, user_id, key, body):
+        fetched = []
+
+        def fetch():
+            fetched.append(True)
+            return crawler_breaker.call(fetch_records_by_deadline, body)
+
+        try:
+            crawler_cache.get_or_fetch(key, fetch)
+            failed = False
+        except Exception:
+            failed = True
+        with self._lock:
+            self.in_flight -= 1
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+            if failed:
+                self.failed += 1
+                return
+            self.completed += 1
+            if fetched:
+                self.fetched += 1
+                self._prefetched[key] = True
+                while len(self._prefetched) > crawler_cache.max_size:
+                    self._prefetched.popitem(last=False)
+
+    def claim(self, key):
+        """Count a hit when ``key`` was prefetched and is still cached."""
+        with self._lock:
+            if self._prefetched.pop(key, None) is None:
+                return False
+        if crawler_cache.get(key) is None:
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "scheduled": self.scheduled,
+                "skipped": self.skipped,
+                "completed": self.completed,
+                "failed": self.failed,
+                "fetched": self.fetched,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.fetched if self.fetched else 0.0,
+            }
+
+
+def next_page_body(body, result):
+    """The crawler body of the page after ``body``, None after the last page."""
+    try:
+        skip = int(body["skip"]) + int(body["top"])
+    except (TypeError, ValueError):
+        return None
+    totals = [
+        result.get(section, {}).get("total_count")
+        for section in ("patents", "innovators")
+    ]
+    totals = [total for total in totals if isinstance(total, int)]
+    if totals and skip >= max(totals):
+        return None
+    return dict(body, skip=skip)
+
+
+search_prefetcher = SearchPrefetcher(
+    settings.CRAWLER_PREFETCH_MAX_IN_FLIGHT, settings.CRAWLER_PREFETCH_MAX_PER_USER
+)
@@ -0,0 +1,204 @@
+"""
+helpers shared by the platform search views
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import ijson
+import requests
+
+from users.models import UserSearch
+from utils.circuit_breaker import crawler_breaker
+from utils.crawler_cache import crawler_cache
+from utils.crawler_client import (
+    call_by_deadline,
+    crawler_client,
+    fetch_records_by_deadline,
+)
+from utils.search_hit_buffer import search_hit_buffer
+from utils.search_prefetch import search_prefetcher
+from web_crawler import settings
+
+logger = logging.getLogger(__name__)
+
+# shared by all batch searches of the process, bounds upstream concurrency
+search_executor = ThreadPoolExecutor(
+    max_workers=settings.CRAWLER_BATCH_WORKERS, thread_name_prefix="crawler"
+)
+
+
+def _as_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_search_body(query, limit=10):
+    # numbers as ints, so "10" and 10 share a cache entry, the page size is
+    # clamped to CRAWLER_MAX_PAGE_SIZE and the offset to >= 0
+    top = min(max(_as_int(limit, 10), 1), settings.CRAWLER_MAX_PAGE_SIZE)
+    return {
+        "query": query.get("search_value"),
+        "record_id": query.get("record_id", ""),
+        "record_type": query.get("record_type", ""),
+        "skip": max(_as_int(query.get("index", 0), 0), 0),
+        "top": top,
+    }
+
+
+def fetch_search_result(body):
+    """Return the crawler result for ``body`` and whether it is a stale copy.
+
+    Calls go through the circuit breaker with a deadline. When they fail, an
+    expired cached result is served instead, if there is one.
+    """
+    key = crawler_cache.make_key(body)
+    search_prefetcher.claim(key)
+    try:
+        api_response = crawler_cache.get_or_fetch(
+            key, lambda: crawler_breaker.call(fetch_records_by_deadline, body)
+        )
+        stale = False
+    except Exception:
+        api_response = crawler_cache.get_stale(key)
+        if api_response is None:
+            raise
+        stale = True
+    return api_response.get("result", {}), stale
+
+
+def search_summary(result):
+    """The UserSearch columns copied from a crawler result."""
+    patents = result.get("patents", {})
+    innovators = result.get("innovators", {})
+    return {
+        "search_result_id": result.get("search_id", ""),
+        "patent_count": patents.get("total_count", 0),
+        "patent_id": patents.get("id", ""),
+        "patent_name": patents.get("name", ""),
+        "innovator_count": innovators.get("total_count", 0),
+        "innovator_id": innovators.get("id", ""),
+        "innovator_name": innovators.get("name", ""),
+    }
+
+
+def new_ids(ids, previous_ids):
+    """The comma separated ``ids`` missing from ``previous_ids``, in order."""
+    previous = set(filter(None, (previous_ids or "").split(",")))
+    return [item for item in (ids or "").split(",") if item and item not in previous]
+
+
+class ResultSummaryReader:
+    """Incrementally parse a crawler response for the fields search_summary reads.
+
+    Chunks are fed as they arrive and dropped, so memory does not grow with
+    the number of records in the response.
+    """
+
+    SUMMARY_FIELDS = {
+        "result.search_id": (None, "search_id"),
+        "result.patents.total_count": ("patents", "total_count"),
+        "result.patents.id": ("patents", "id"),
+        "result.patents.name": ("patents", "name"),
+        "result.innovators.total_count": ("innovators", "total_count"),
+        "result.innovators.id": ("innovators", "id"),
+        "result.innovators.name": ("innovators", "name"),
+    }
+    SCALAR_EVENTS = ("string", "number", "boolean", "null")
+
+    def __init__(self):
+        self.result = {}
+        self.failed = False
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events)
+
+    def feed(self, chunk):
+        if self.failed:
+            return
+        try:
+            self._parser.send(chunk)
+        except ijson.JSONError as ex:
+            logger.error(ex)
+            self.failed = True
+        self._collect()
+
+    def close(self):
+        """The summary fields as a crawler result, None for an invalid body."""
+        if not self.failed:
+            try:
+                self._parser.close()
+            except ijson.JSONError as ex:
+                logger.error(ex)
+                self.failed = True
+            self._collect()
+        return None if self.failed else self.result
+
+    def _collect(self):
+        for prefix, event, value in self._events:
+            field = self.SUMMARY_FIELDS.get(prefix)
+            if field is None or event not in self.SCALAR_EVENTS:
+                continue
+            section, name = field
+            target = self.result.setdefault(section, {}) if section else self.result
+            target[name] = value
+        del self._events[:]
+
+
+def stream_search_result(body, on_result):
+    """Open a crawler search and return an iterator over its raw body.
+
+    The body is passed through unchanged. Once it has been read completely
+    ``on_result`` is called with the summary fields of the result. The
+    crawler has CRAWLER_DEADLINE seconds to answer and as long for every
+    read of the body after that.
+    """
+    timeout = (crawler_client.timeout[0], settings.CRAWLER_DEADLINE)
+    response = crawler_breaker.call(
+        call_by_deadline,
+        crawler_client.stream_records,
+        body,
+        timeout,
+        on_late=lambda late_response: late_response.close(),
+    )
+    content_type = response.headers.get("Content-Type", "application/json")
+
+    def chunks():
+        reader = ResultSummaryReader()
+        try:
+            for chunk in response.iter_content(settings.CRAWLER_STREAM_CHUNK_SIZE):
+                reader.feed(chunk)
+                yield chunk
+        except requests.RequestException as ex:
+            # the status is sent already, the client gets a truncated body
+            logger.error(ex)
+            return
+        finally:
+            response.close()
+        result = reader.close()
+        if result is not None:
+            on_result(result)
+
+    return chunks(), content_type
+
+
+def record_searches(user_obj, searches):
+    """Count one hit per ``(search_value, search_type, result)`` in ``searches``.
+
+    All hits go to UserSearch.objects.record_hits as one upsert, or to the
+    process' search_hit_buffer with SEARCH_HIT_WRITE_BEHIND.
+    """
+    hits = {}
+    for search_value, search_type, result in searches:
+        summary = search_summary(result)
+        fields = hits.setdefault(
+            summary["search_result_id"],
+            dict(summary, search_value=search_value, search_type=search_type),
+        )
+        fields["search_count"] = fields.get("search_count", 0) + 1
+
+    rows = [dict(fields, user_id=user_obj) for fields in hits.values()]
+    if settings.SEARCH_HIT_WRITE_BEHIND:
+        search_hit_buffer.add(rows)
+    else:
+        UserSearch.objects.record_hits(rows)
@@ -0,0 +1,88 @@
+"""
+bounded LRU/TTL cache of verified access tokens
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from web_crawler import settings
+
+
+class TokenCache:
+    """Per-process cache of access tokens already checked against the Token table.
+
+    An entry lives for at most ``ttl`` seconds and never past the token's own
+    ``exp``. The cache is local to the worker process and invalidation only
+    evicts this process' entries: a token logged out through another worker
+    is still accepted here for up to ``ttl`` seconds.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def set(self, token, payload):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        token_exp = payload.get("exp")
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._entries[token] = (payload, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            stale = [
+                token
+                for token, (payload, _) in self._entries.items()
+                if payload.get("user_id") == user_id
+            ]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
@@ -0,0 +1,108 @@
+"""
+denylist of revoked jwt ids (jti)
+"""
+import time
+from datetime import datetime
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from users.models import Token
+from web_crawler import settings
+
+CACHE_KEY_PREFIX = "revoked-jti:"
+PRUNE_INTERVAL = 60
+# backends other worker processes can't read
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class TokenDenylist:
+    """Revoked-but-unexpired token ids.
+
+    Every process keeps the ids it knows of in memory. Revocations are also
+    written to the shared cache, so other workers find them on their next
+    lookup. The in-memory set is rebuilt from expired Token rows the first
+    time a process needs it. With a process-local cache the denylist is not
+    ``shared`` and callers have to check the Token table instead.
+    """
+
+    def __init__(self, cache_alias):
+        self.cache_alias = cache_alias
+        self._revoked = {}
+        self._loaded = False
+        self._pruned_at = time.time()
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def shared(self):
+        return not isinstance(self.cache, PROCESS_LOCAL_CACHES)
+
+    def revoke(self, jti, exp):
+        """Deny ``jti`` until ``exp`` (unix timestamp)."""
+        timeout = int(exp - time.time()) + 1
+        if not jti or timeout <= 0:
+            return
+        with self._lock:
+            self._revoked[jti] = exp
+        self.cache.set(CACHE_KEY_PREFIX + jti, exp, timeout)
+        if time.time() - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def is_revoked(self, jti):
+        if not self._loaded:
+            self.load()
+        now = time.time()
+        exp = self._revoked.get(jti)
+        if exp is not None:
+            if exp > now:
+                return True
+            with self._lock:
+                self._revoked.pop(jti, None)
+            return False
+        exp = self.cache.get(CACHE_KEY_PREFIX + jti)
+        if exp is not None and exp > now:
+            with self._lock:
+                self._revoked[jti] = exp
+            return True
+        return False
+
+    def load(self):
+        revoked = {}
+        rows = Token.objects.filter(
+            is_expired=True, expires_at__gt=datetime.now()
+        ).values_list("access_jti", "refresh_jti", "expires_at")
+        for access_jti, refresh_jti, expires_at in rows.iterator():
+            exp = expires_at.timestamp()
+            for jti in (access_jti, refresh_jti):
+                if jti:
+                    revoked[jti] = exp
+        with self._lock:
+            revoked.update(self._revoked)
+            self._revoked = revoked
+            self._loaded = True
+        self.prune()
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            self._pruned_at = now
+            self._revoked = {
+                jti: exp for jti, exp in self._revoked.items() if exp > now
+            }
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._loaded = False
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+token_denylist = TokenDenylist(settings.TOKEN_DENYLIST_CACHE)